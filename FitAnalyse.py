@@ -1,6 +1,5 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-3
-import MDAnalysis as mda
 import numpy as np
 import os
 
@@ -9,74 +8,93 @@ import argparse
 # import attr
 
 from pathlib import Path
-# from typing import Set, Dict, Tuple, Any
+from typing import Dict, List, Tuple
 
 from project import Project
-from utils import WC_PROPERTIES, DH_ATOMS, ignored
-from bdna import BDna
+from utils import ignored
+from bdna import BDna, METRICS
+from accumulator import TrajectoryAccumulator
+from store import RunStore
+from checkpoint import Checkpoint, run_signature
+from frames import FrameSelection
+from integrity import integrity_per_residue, integrity_counts
+from atomprops import (
+    AtomPropertyWriter, ATOM_PROPERTIES, residue_properties, export_pdb
+)
 from linker import get_linkage
+from linkage import Linkage
+from mrcmap import MrcMap
+from fitscore import FitScore, residue_scores, motif_selections
+from segmentation import categorise
 from version import __version__, __authors__
 
 
 __descr__ = """
     computes watson crick base pairs.
-    they are returned as to dictionaries. this process is repeated for each
-    Hbond-deviation criterion.
-    subsequently universe and dicts are stored into a pickle. each deviation
-    criterion is stored in one pickle.
-    creates multiframe pdbs with the respective properties as temp-factors.
+    they are returned as to dictionaries. basepair integrity is classified
+    for each Hbond-deviation criterion, per residue and as number of broken
+    basepairs per frame.
+    all properties of all frames are stored in one analysis store
+    (analysis/{name}__store) or accumulated into running statistics.
+    stores per-atom properties of all frames in one binary store, pdbs with
+    a property as temp-factor are exported on demand.
+    progress is checkpointed, an interrupted run continues with --resume.
+    map-model fit (cc, q) is scored per residue and per motif with --score.
 """
 
 
-def write_pdb(u, bDNA, PDBs):
-    u.add_TopologyAttr(
-        mda.core.topologyattrs.Tempfactors(np.zeros(len(u.atoms))))
-    u.trajectory[0]
-    u.atoms.tempfactors = -1.
-    co_keys = list(bDNA.link.Fco.keys())
-    for res in u.residues:
+# markup codes: scaffold crossover, staple crossover, nick, other
+CO_MARKUP: dict = {"scaffold_co": 0, "staple_co": 1, "nick": 2, "other": 3}
+CO_MARKUP_TEMPFACTOR: "np.ndarray" = np.array([50., 90., 20., 10.])
 
-        is_nick = (res.resindex in bDNA.link.Fnicks.keys()
-                   or res.resindex in bDNA.link.Fnicks.values()
-                   )
-        h, p, is_scaff = bDNA.link.DidDhps[bDNA.link.FidDid[res.resindex]]
-        cond = len(
-            [True for key in co_keys if ("({}, {})".format(h, p) in key)]
-        ) > 0
-        is_co = True if cond else False
-
-        if is_co and is_scaff:
-            res.atoms.tempfactors = 50.
-        elif is_co and not is_scaff:
-            res.atoms.tempfactors = 90.
-        elif is_nick:
-            res.atoms.tempfactors = 20.
-        else:
-            res.atoms.tempfactors = 10.
-    PDBs["co_markup"].write(u.atoms)
 
+def get_co_markup(link: Linkage) -> "np.ndarray":
+    """ markup code (CO_MARKUP) per residue. residues at a crossover position
+        (helix, position) of either strand are marked as crossover.
+    """
+    co_hp = {P.hp for co in link.Fco.values() for P in co.Ps if P is not None}
+    nicks = set(link.Fnicks.keys()) | set(link.Fnicks.values())
+    markup = np.full(len(link.u.residues), CO_MARKUP["other"], dtype=int)
+    for resindex in link.u.residues.resindices:
+        h, p, is_scaff = link.DidDhps[link.FidDid[resindex]]
+        if (h, p) in co_hp:
+            markup[resindex] = (CO_MARKUP["scaffold_co"] if is_scaff
+                                else CO_MARKUP["staple_co"])
+        elif resindex in nicks:
+            markup[resindex] = CO_MARKUP["nick"]
+    return markup
 
-def local_res(u: "mda.universe", bDNA: BDna, project: Project) -> None:
-    path_color = project.input / "{}_localres.mrc".format(project.name)
-    localres = bDNA._mrc_localres(path_in=str(path_color))
+
+def local_res(bDNA: BDna, project: Project, localres_map: MrcMap
+              ) -> Dict[int, float]:
+    localres = bDNA._mrc_localres(mrc_map=localres_map)
     output = project.output / "{}__localres.p".format(project.name)
     pickle.dump(localres, open(output, "wb"))
+    return localres
 
-    # TODO: move to pdb_write
-    if project.pdb:
-        path_colorpdb = project.output / "{}_localres.pdb".format(project.name)
-        pdb = mda.Writer(path_colorpdb, multiframe=True)
-        empty_TopoAttr = np.zeros(len(u.atoms))
-        u.add_TopologyAttr(mda.core.topologyattrs.Tempfactors(empty_TopoAttr))
-        u.atoms.tempfactors = -1.
-        for res in u.residues:
-            res.atoms.tempfactors = localres[res.resindex]
-        pdb.write(u.atoms)
+
+def fit_score(scorer: FitScore, link: Linkage,
+              motifs: Dict[str, tuple],
+              ) -> Tuple[Dict[int, dict], Dict[str, dict]]:
+    scores = scorer.score(atoms=link.u.atoms)
+    per_residue = residue_scores(scores, link.u.residues.resindices)
+    per_motif = {name: {"cc": cc} for name, cc
+                 in scorer.motif_cc(scores["moments"], motifs).items()
+                 }
+    return per_residue, per_motif
 
 
 def proc_input():
     def get_description() -> str:
         return "{}\n {}\n {}".format(__descr__, __version__, __authors__)
+
+    def metrics_list(string: str) -> List[str]:
+        metrics = [m.strip() for m in string.split(",") if m.strip()]
+        unknown = set(metrics) - set(METRICS)
+        if unknown or not metrics:
+            raise argparse.ArgumentTypeError(
+                "choose from {}".format(",".join(METRICS)))
+        return metrics
     parser = argparse.ArgumentParser(
         description=get_description(),
         formatter_class=argparse.ArgumentDefaultsHelpFormatter
@@ -93,14 +111,41 @@ def proc_input():
                         default=argparse.SUPPRESS,
                         )
     parser.add_argument("--frames",
-                        help="number of frames samples",
+                        help="number of evenly spaced frames, ending at last",
                         type=int,
                         default=1,
                         )
+    parser.add_argument("--start",
+                        help="first frame of trajectory slice",
+                        type=int,
+                        default=None,
+                        )
+    parser.add_argument("--stop",
+                        help="stop frame (exclusive) of trajectory slice",
+                        type=int,
+                        default=None,
+                        )
+    parser.add_argument("--step",
+                        help="step of trajectory slice",
+                        type=int,
+                        default=None,
+                        )
+    parser.add_argument("--frame-list",
+                        help="explicit frame indices (overrides slicing)",
+                        type=int,
+                        nargs="+",
+                        default=None,
+                        )
+    parser.add_argument("--last",
+                        help="analyse the last N frames",
+                        type=int,
+                        default=None,
+                        )
     parser.add_argument("--dev",
-                        help="deviation of H-bond",
+                        help="relative H-bond deviation thresholds",
                         type=float,
-                        default=0.1,
+                        nargs="+",
+                        default=[0.1],
                         )
     parser.add_argument("--relink",
                         help="force relink fit",
@@ -110,20 +155,88 @@ def proc_input():
                         help="compute localres per molecule",
                         action="store_true"
                         )
+    parser.add_argument("--bin",
+                        help="bin the localres map by this factor",
+                        type=int,
+                        default=1,
+                        )
+    parser.add_argument("--score",
+                        help="score map-model fit per residue and motif",
+                        action="store_true"
+                        )
+    parser.add_argument("--resolution",
+                        help="map resolution for --score in Angstrom",
+                        type=float,
+                        default=6.,
+                        )
     parser.add_argument("--pdb",
-                        help="create colored pdb file (slow)",
+                        help="store per-atom properties for pdb export",
+                        action="store_true"
+                        )
+    parser.add_argument("--precision",
+                        help="dtype of stored per-atom properties",
+                        choices=["float16", "float32"],
+                        default="float32",
+                        )
+    parser.add_argument("--export",
+                        help="export stored property to pdb and exit",
+                        choices=ATOM_PROPERTIES,
+                        default=None,
+                        )
+    parser.add_argument("--export-frame",
+                        help="index of the stored frame for --export",
+                        type=int,
+                        default=-1,
+                        )
+    parser.add_argument("--metrics",
+                        help="comma separated selection of BDna metrics",
+                        type=metrics_list,
+                        default=",".join(METRICS),
+                        )
+    parser.add_argument("--accumulate",
+                        help="running statistics instead of analysis store",
                         action="store_true"
                         )
+    parser.add_argument("--bins",
+                        help="histogram bins for --accumulate (0: none)",
+                        type=int,
+                        default=0,
+                        )
+    parser.add_argument("--resume",
+                        help="continue after the last checkpointed frame",
+                        action="store_true"
+                        )
+    parser.add_argument("--checkpoint",
+                        help="write a checkpoint every N frames",
+                        type=int,
+                        default=10,
+                        )
     args = parser.parse_args()
     project = Project(
         input=Path(args.folder),
         output=Path(args.folder) / "analysis",
         name=args.name,
         frames=args.frames,
+        start=args.start,
+        stop=args.stop,
+        step=args.step,
+        frame_list=args.frame_list,
+        last=args.last,
         dev=args.dev,
         relink=args.relink,
         localres=args.localres,
+        binning=args.bin,
+        score=args.score,
+        resolution=args.resolution,
         pdb=args.pdb,
+        precision=args.precision,
+        export=args.export,
+        export_frame=args.export_frame,
+        accumulate=args.accumulate,
+        bins=args.bins,
+        metrics=args.metrics,
+        resume=args.resume,
+        checkpoint=args.checkpoint,
     )
 
     with ignored(FileExistsError):
@@ -131,68 +244,166 @@ def proc_input():
     return project
 
 
-def main():
-    project = proc_input()
-    link = get_linkage(project)
+def analyse(project: Project, link: Linkage) -> None:
+    """ analyse (or export) the selected frames of the linked fit
+    """
+    frames = FrameSelection.from_project(project)
+    path_atomprops = project.output / "{}__atomprops".format(project.name)
+    path_store = project.output / "{}__store".format(project.name)
+    selected = frames.select(len(link.u.trajectory))
+    n_frames = len(selected)
 
-    if project.frames == 1:
-        frames = [-1]
-    else:
-        frames_step = int(len(link.u.trajectory) / project.frames)
-        frames = list((range(len(link.u.trajectory) - 1), 0, -frames_step))
-    properties = []
-    traj_out = project.output / "frames"
-    with ignored(FileExistsError):
-        os.mkdir(traj_out)
+    if project.export is not None:
+        path_pdb = project.output / "{}__{}-{}.pdb".format(
+            project.name, project.export, project.export_frame)
+        print("export", project.export, "to", path_pdb)
+        export_pdb(u=link.u,
+                   path=path_atomprops,
+                   prop=project.export,
+                   frame=project.export_frame,
+                   path_pdb=path_pdb,
+                   )
+        return
+
+    checkpoint = Checkpoint(
+        path=project.output / "{}__checkpoint.p".format(project.name),
+        run=run_signature(frames=selected,
+                          link_hash=link.hash(),
+                          metrics=project.metrics,
+                          thresholds=project.dev,
+                          localres=project.localres,
+                          binning=project.binning,
+                          score=project.score,
+                          resolution=project.resolution,
+                          accumulate=project.accumulate,
+                          bins=project.bins,
+                          pdb=project.pdb,
+                          precision=project.precision,
+                          ),
+        every=project.checkpoint,
+    )
+    completed = checkpoint.resume() if project.resume else 0
 
     if project.pdb:
-        # open PDB files
-        PDBs = {}
-        for name in [*WC_PROPERTIES, "bp", "qual", "co_markup"]:
-            pdb_name = project.output / "{}__bp_{}.pdb".format(project.name,
-                                                               name)
-            PDBs[name] = mda.Writer(pdb_name, multiframe=True)
-        for name in DH_ATOMS:
-            pdb_name = project.output / "{}__dh_{}.pdb".format(project.name,
-                                                               name)
-            PDBs[name] = mda.Writer(pdb_name, multiframe=True)
+        atomprops = AtomPropertyWriter(path=path_atomprops,
+                                       n_frames=n_frames,
+                                       u=link.u,
+                                       precision=project.precision,
+                                       resume=completed,
+                                       )
+        co_markup = CO_MARKUP_TEMPFACTOR[get_co_markup(link)]
+
+    keys_res = list(link.u.residues.resindices)
+    keys_co = list(link.Fco.keys())
+    if project.accumulate:
+        accumulator = checkpoint.accumulator
+        if accumulator is None:
+            accumulator = TrajectoryAccumulator(bins=project.bins)
+    elif completed:
+        store = RunStore(path=path_store, capacity=n_frames)
+        store.check_linkage(link)
+        store.truncate(completed)
+    else:
+        store = RunStore.new(path=path_store, capacity=n_frames)
+        store.check_linkage(link)
+
+    if project.score:
+        path_map = project.input / "{}.mrc".format(project.name)
+        mrc_map = MrcMap(path_map)
+        scorer = FitScore(mrc_map=mrc_map, resolution=project.resolution)
+        motifs = motif_selections(categorise(link=link, project=project))
+        keys_motif = sorted(motifs)
+
+    if project.localres:
+        path_color = project.input / "{}_localres.mrc".format(project.name)
+        localres_map = MrcMap(path_color, binning=project.binning)
+
+    # atom index table of the basepairs, built once per run
+    integrity = None
 
     # loop over selected frames
-    for i, ts in enumerate([link.u.trajectory[i] for i in frames]):
+    for i, ts in frames.iterate(link.u.trajectory, skip=completed):
         print(ts)
 
         # perform analyis
         print("eval_fit", project.name)
-        bDNA = BDna(link)
-        bDNA.sample()
+        bDNA = BDna(link, thresholds=project.dev, integrity=integrity)
+        bDNA.sample(metrics=project.metrics)
+        integrity = bDNA.integrity
 
         # TODO: every frame?
+        localres = None
         if project.localres:
             print("compute per residue resolution")
-            local_res(u=link.u, bDNA=bDNA, project=project)
+            localres = local_res(bDNA=bDNA, project=project,
+                                 localres_map=localres_map,
+                                 )
 
-        # TODO: every frame?
-        properties.append(bDNA)
-        props_tuple = [
-            (bDNA.bp_geometry_local, "bp_geometry_local"),
-            (bDNA.bp_geometry_global, "bp_geometry_global"),
-            (bDNA.bp_quality, "bp_quality"),
-            (bDNA.dh_quality, "dh_quality"), (bDNA.distances, "distances"),
-            (bDNA.co_angles, "co_angles")
-        ]
-        for prop, prop_name in props_tuple:
-            pickle_name = traj_out / "{}__bDNA-{}-{}.p".format(project.name,
-                                                               prop_name,
-                                                               i,
-                                                               )
-            pickle.dump((ts, prop), open(pickle_name, "wb"))
+        if project.score:
+            print("score map-model fit")
+            per_residue, per_motif = fit_score(scorer=scorer, link=link,
+                                               motifs=motifs,
+                                               )
+
+        props = dict()
+        for metric in project.metrics:
+            for prop_name in METRICS[metric].properties:
+                prop = getattr(bDNA, prop_name)
+                if prop_name == "bp_integrity":
+                    counts = integrity_counts(prop)
+                    props["bp_integrity_counts"] = (counts, list(counts))
+                    n_bp = len(prop["resindices"])
+                    prop = integrity_per_residue(prop)
+                keys = keys_co if prop_name == "co_angles" else keys_res
+                props[prop_name] = (prop, keys)
+        if localres is not None:
+            props["localres"] = (localres, keys_res)
+        if project.score:
+            props["fit_score"] = (per_residue, keys_res)
+            props["motif_score"] = (per_motif, keys_motif)
+
+        if project.accumulate:
+            accumulator.add_frame(ts.frame)
+            for prop_name, (prop, keys) in props.items():
+                hist_range = ((0., float(n_bp))
+                              if prop_name == "bp_integrity_counts" else None)
+                accumulator.add(prop_name, prop, keys, hist_range)
+        else:
+            store.append(frame=ts.frame, time=ts.time, props=props)
         if project.pdb:
-            print("write pdbs", project.name)
-            write_pdb(link.u, bDNA, PDBs)
+            print("write atom properties", project.name)
+            values = residue_properties(bDNA=bDNA,
+                                        co_markup=co_markup,
+                                        localres=localres,
+                                        )
+            atomprops.write(i, values, ts)
+
+        if checkpoint.is_due(i + 1, n_frames):
+            if project.pdb:
+                atomprops.flush()
+            checkpoint.save(completed=i + 1,
+                            accumulator=(accumulator if project.accumulate
+                                         else None),
+                            )
 
     if project.pdb:
-        for _, PDB in PDBs.items():
-            PDB.close()
+        atomprops.close()
+    if project.score:
+        mrc_map.close()
+    if project.localres:
+        localres_map.close()
+
+    if project.accumulate:
+        summary_name = project.output / "{}__bDNA-summary.p".format(
+            project.name)
+        print("write summary", summary_name)
+        accumulator.dump(summary_name)
+
+
+def main():
+    project = proc_input()
+    link = get_linkage(project)
+    analyse(project, link)
 
 
 if __name__ == "__main__":
@@ -1,18 +1,30 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import MDAnalysis as mda
 import argparse
 import os
+import shutil
 import sys
+import time
+import numpy as np
 
 
+from collections import Counter
 from pathlib import Path
 
 from project import Project
 from utils import ignored
 from linker import get_linkage
-from segmentation import categorise, mrc_segment
+from segmentation import (
+    categorise, mrc_segment, atom_bounds, SegmentFormat, ResidueAtoms
+)
+from segmentjob import (
+    segment_jobs, segment_stacks, segment_fsc, segment_labels, estimate_bytes,
+    estimate_seconds, SegmentJob
+)
+from labelvolume import LabelVolume
+from mrcmap import MapCache
+from modelmap import ModelMap
 
 _author__ = "Elija Feigl"
 __copyright__ = "Copyright 2019, Dietzlab (TUM)"
@@ -23,18 +35,56 @@ __maintainer__ = "Elija Feigl"
 __email__ = "elija.feigl@tum.de"
 __status__ = "Development"
 
+H1 = "_unfil_half1"
+H2 = "_unfil_half2"
 
-def mask_minimal_box(u, project):
+
+def segment_format(project):
+    return SegmentFormat(precision=project.precision,
+                         compress=project.compress,
+                         )
+
+
+def mask_minimal_box(u, project, maps):
     path_in = project.input / "{}.mrc".format(project.name)
     path_out = project.output / "{}-masked.mrc".format(project.name)
     mrc_segment(
         atoms=u.atoms,
-        path_in=path_in,
+        mrc_map=maps[path_in],
         path_out=path_out,
         context=project.context,
+        spherical=project.spherical,
+        output=segment_format(project),
     )
 
 
+def model_map(u, project, maps):
+    path_in = project.input / "{}.mrc".format(project.name)
+    path_out = project.output / "{}__modelmap.mrc".format(project.name)
+    model = ModelMap(mrc_map=maps[path_in], resolution=project.resolution)
+    data, low = model.simulate(atoms=u.atoms)
+    model.write(path=path_out, data=data, low=low)
+
+
+def structure_bytes(u, project, output, maps, volume=None):
+    """ upper bound of the size of the maps of the whole structure: masked
+        minimal box in the segment format, model map and label volume
+        (float32, uncompressed)
+    """
+    mrc_map = maps[project.input / "{}.mrc".format(project.name)]
+    float32 = SegmentFormat()
+    low, high = atom_bounds(u.atoms.positions, mrc_map, project.context)
+    box = int(np.max(high - low))
+    sizes = {"masked map": output.nbytes((box, box, box))}
+    if project.modelmap:
+        model = ModelMap(mrc_map=mrc_map, resolution=project.resolution)
+        low, high = model.bounds(u.atoms.positions)
+        sizes["model map"] = float32.nbytes(tuple(high - low))
+    if volume is not None:
+        sizes["label volume"] = float32.nbytes(volume.labels.shape)
+    return sizes
+
+
 def check_abort() -> None:
     yes = {"yes", "y", "ye"}
     no = {"no", "n"}
@@ -54,6 +104,9 @@ def get_description() -> str:
     return """cut subset from map according to atoms belongign to sepcific
               motif. Also produces minimal box map. can also segment halfmaps
               and evaluate local-resolution per residue -> dict and pdb
+              or per motif from the FSC of the segmented halfmaps (--fsc,
+              no segments are written).
+              --plan reports the cost of a run, --yes runs without prompt
               """
 
 
@@ -78,6 +131,10 @@ def proc_input() -> Project:
                         type=int,
                         default=5,
                         )
+    parser.add_argument("--spherical",
+                        help="spherical context instead of cube",
+                        action="store_true"
+                        )
     parser.add_argument("--range",
                         help="number of addit. basepairs in helix of motif",
                         type=int,
@@ -87,59 +144,111 @@ def proc_input() -> Project:
                         help="also segment halfmaps",
                         action="store_true"
                         )
+    parser.add_argument("--fsc",
+                        help="local resolution per motif from the FSC of "
+                             "the segmented halfmaps, written to a star file "
+                             "instead of the segments",
+                        action="store_true"
+                        )
     parser.add_argument("--star",
                         help="create starfile",
                         action="store_true"
                         )
+    parser.add_argument("--modelmap",
+                        help="simulate model map of the fit on the map grid",
+                        action="store_true"
+                        )
+    parser.add_argument("--resolution",
+                        help="resolution of the model map in Angstrom",
+                        type=float,
+                        default=6.,
+                        )
+    output_mode = parser.add_mutually_exclusive_group()
+    output_mode.add_argument("--stack",
+                             help="one padded .mrcs stack per motif class "
+                                  "and one star file indexing all segments",
+                             action="store_true"
+                             )
+    output_mode.add_argument("--labels",
+                             help="segment all motifs from one residue label "
+                                  "volume (nearest residue per voxel) in one "
+                                  "process",
+                             action="store_true"
+                             )
+    parser.add_argument("--bin",
+                        help="bin maps by this factor for a fast preview",
+                        type=int,
+                        default=1,
+                        )
+    parser.add_argument("--precision",
+                        help="dtype of written segments (float16: mode 12)",
+                        choices=["float32", "float16"],
+                        default="float32",
+                        )
+    parser.add_argument("--gzip",
+                        help="gzip compressed segments (.mrc.gz)",
+                        action="store_true"
+                        )
+    parser.add_argument("--workers",
+                        help="number of processes for motif segmentation",
+                        type=int,
+                        default=1,
+                        )
+    parser.add_argument("--yes",
+                        help="segment without confirmation (batch mode)",
+                        action="store_true"
+                        )
+    parser.add_argument("--plan",
+                        help="report segments, output size and runtime "
+                             "estimates, then exit",
+                        action="store_true"
+                        )
     parser.add_argument("--relink",
                         help="force relink fit",
                         action="store_true"
                         )
     args = parser.parse_args()
+    if args.labels and args.workers > 1:
+        print("--labels segments in one process, --workers {} is ignored"
+              .format(args.workers))
     project = Project(input=Path(args.folder),
                       output=Path(args.folder) / "analysis",
                       name=args.name,
                       context=args.context,
                       range=args.range,
                       halfmap=args.halfmap,
+                      fsc=args.fsc,
                       star=args.star,
+                      spherical=args.spherical,
+                      workers=args.workers,
+                      stack=args.stack,
+                      labels=args.labels,
+                      binning=args.bin,
+                      precision=args.precision,
+                      compress=args.gzip,
+                      modelmap=args.modelmap,
+                      resolution=args.resolution,
+                      yes=args.yes,
+                      plan=args.plan,
                       relink=args.relink,
                       )
     return project
 
 
-def main():
-    H1 = "_unfil_half1"
-    H2 = "_unfil_half2"
-
-    project = proc_input()
-    link = get_linkage(project)
-    link.u.trajectory[-1]
-
-    print("mask minimal box")
-    mask_minimal_box(link.u, project)
-
-    if project.halfmap:
-        print("segmenting halfmaps")
-
-    check_abort()
-    motifs = categorise(link=link, project=project)
+def motif_jobs(link, project, motifs, specs):
+    """ one SegmentJob per motif, output folder per motif category
+    """
+    residue_atoms = ResidueAtoms(link.u)
+    jobs, paths_motif = list(), list()
     for motif_name, motif in motifs.items():
         path_motif = project.output / motif_name
-        print("output to ", path_motif)
-        with ignored(FileExistsError):
-            os.mkdir(path_motif)
+        paths_motif.append(path_motif)
 
         for subset in motif:
             base_selection, key, typ = subset
-            atoms_select = mda.AtomGroup([], link.u)
-            for resindex in base_selection:
-                atoms_select += link.u.residues[resindex].atoms
-
-            if project.halfmap:
-                specs = {"-segment": "", H1: "h1-", H2: "h2-"}
-            else:
-                specs = {"-segment": ""}
+            atoms_select = residue_atoms.atoms(base_selection)
+
+            paths_in, paths_out, paths_stack = list(), list(), list()
             for halfmap_inp, halfmap_out in specs.items():
                 in_suffix = "{}{}.mrc".format(project.name,
                                               halfmap_inp,
@@ -149,15 +258,185 @@ def main():
                                                       typ,
                                                       key,
                                                       )
-                path_in = project.input / in_suffix
-                path_out = path_motif / out_suffix
-                mrc_segment(
-                    atoms=atoms_select,
-                    path_in=path_in,
-                    path_out=path_out,
+                stack_suffix = "{}__{}{}.mrcs".format(project.name,
+                                                      halfmap_out,
+                                                      motif_name,
+                                                      )
+                paths_in.append(project.input / in_suffix)
+                paths_out.append(path_motif / out_suffix)
+                paths_stack.append(path_motif / stack_suffix)
+            jobs.append(SegmentJob(positions=atoms_select.positions,
+                                   paths_in=paths_in,
+                                   paths_out=paths_out,
+                                   paths_stack=paths_stack,
+                                   typ=typ,
+                                   resindices=base_selection,
+                                   ))
+    return jobs, paths_motif
+
+
+def label_volume(link, project, maps):
+    start = time.perf_counter()
+    volume = LabelVolume.from_atoms(
+        atoms=link.u.atoms,
+        mrc_map=maps[project.input / "{}.mrc".format(project.name)],
+        context=project.context,
+        spherical=project.spherical,
+    )
+    print("label volume in {:.1f} s".format(time.perf_counter() - start))
+    return volume
+
+
+def local_fsc_jobs(jobs, project):
+    """ first segment of every job cut from both half maps
+    """
+    paths_half = [project.input / "{}{}.mrc".format(project.name, half)
+                  for half in [H1, H2]
+                  ]
+    return [SegmentJob(positions=job.positions,
+                       paths_in=paths_half,
+                       paths_out=job.paths_out[:1],
+                       typ=job.typ,
+                       )
+            for job in jobs
+            ]
+
+
+def report_plan(u, jobs, project, output, maps, volume=None, runtime=True):
+    """ print number of segments and output size (map headers only) of the
+        segmentation that will run, including the maps of the whole
+        structure. runtime: also estimate the runtime of the segments from
+        a timed sample of jobs (labels, stacks, local fsc, writes)
+    """
+    counts = Counter(job.typ for job in jobs)
+    fsc_jobs = local_fsc_jobs(jobs, project) if project.fsc else None
+    if project.fsc:
+        jobs = list()
+    n_segments = sum(len(job.paths_out) for job in jobs)
+    sizes = structure_bytes(u, project, output, maps, volume)
+    sizes["segments"] = estimate_bytes(jobs=jobs,
+                                       maps=maps,
+                                       context=project.context,
+                                       stack=project.stack,
+                                       output=output,
+                                       )
+    n_bytes = sum(sizes.values())
+    print("plan: {} motifs, {} segments{}".format(
+        sum(counts.values()), n_segments, ", local fsc" if fsc_jobs else ""))
+    for typ, count in sorted(counts.items()):
+        print("    {:<16} {:>6}".format(typ, count))
+    print("estimated output size {:.1f} MB{}".format(
+        n_bytes / 1e6, " before compression" if output.compress else ""))
+    for name, size in sizes.items():
+        print("    {:<16} {:>9.1f} MB".format(name, size / 1e6))
+    free = shutil.disk_usage(str(project.output)).free
+    if n_bytes > free:
+        print("WARNING: estimated output size exceeds the free disk space "
+              "of {} ({:.1f} MB)".format(project.output, free / 1e6))
+    if not runtime:
+        return
+    seconds = estimate_seconds(
+        jobs=jobs,
+        maps=maps,
+        context=project.context,
+        spherical=project.spherical,
+        workers=project.workers,
+        stack=project.stack,
+        volume=volume,
+        fsc_jobs=fsc_jobs,
+        output=output,
+    )
+    print("estimated runtime {:.1f} s with {} workers".format(
+        seconds, project.workers))
+
+
+def segment(link, project, jobs, paths_motif, output, maps, volume=None):
+    """ minimal box, model map, local fsc and motif segments. all maps are
+        opened (and binned) once by maps.
+    """
+    report_plan(link.u, jobs, project, output, maps, volume,
+                runtime=not project.yes)
+    if not project.yes:
+        check_abort()
+
+    print("mask minimal box")
+    mask_minimal_box(link.u, project, maps)
+    if project.modelmap:
+        print("simulate model map")
+        model_map(link.u, project, maps)
+
+    if project.halfmap and not project.fsc:
+        print("segmenting halfmaps")
+
+    if project.fsc:
+        path_star = project.output / "{}__localfsc.star".format(project.name)
+        print("local fsc of {} motifs to {}".format(len(jobs), path_star))
+        segment_fsc(jobs=local_fsc_jobs(jobs, project),
+                    maps=maps,
+                    path_star=path_star,
                     context=project.context,
-                    star=project.star,
-                )
+                    spherical=project.spherical,
+                    workers=project.workers,
+                    )
+        return
+
+    for path_motif in paths_motif:
+        print("output to ", path_motif)
+        with ignored(FileExistsError):
+            os.mkdir(path_motif)
+    print("segmenting {} motifs with {} workers".format(len(jobs),
+                                                        project.workers))
+    if volume is not None:
+        path_labels = project.output / "{}__labels.mrc".format(project.name)
+        print("label volume to", path_labels)
+        volume.write(path_labels)
+        segment_labels(jobs=jobs,
+                       maps=maps,
+                       volume=volume,
+                       star=project.star,
+                       output=output,
+                       )
+    elif project.stack:
+        path_star = project.output / "{}__segments.star".format(project.name)
+        segment_stacks(jobs=jobs,
+                       maps=maps,
+                       path_star=path_star,
+                       context=project.context,
+                       spherical=project.spherical,
+                       workers=project.workers,
+                       output=output,
+                       )
+    else:
+        segment_jobs(jobs=jobs,
+                     maps=maps,
+                     context=project.context,
+                     star=project.star,
+                     spherical=project.spherical,
+                     workers=project.workers,
+                     output=output,
+                     )
+
+
+def main():
+    project = proc_input()
+    link = get_linkage(project)
+    link.u.trajectory[-1]
+
+    motifs = categorise(link=link, project=project)
+    if project.halfmap:
+        specs = {"-segment": "", H1: "h1-", H2: "h2-"}
+    else:
+        specs = {"-segment": ""}
+    jobs, paths_motif = motif_jobs(link, project, motifs, specs)
+    output = segment_format(project)
+    with MapCache(binning=project.binning) as maps:
+        volume = None
+        if project.labels and not project.fsc:
+            volume = label_volume(link, project, maps)
+        if project.plan:
+            report_plan(link.u, jobs, project, output, maps, volume)
+            return
+        segment(link, project, jobs, paths_motif, output, maps, volume)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-3#
+import pickle
+import numpy as np
+import attr
+
+from pathlib import Path
+from typing import Dict, Tuple, Any, List, Optional
+
+from utils import _flatten, Feature
+
+""" DESCR:
+    TrajectoryAccumulator keeps running statistics of BDna properties per
+    residue (or crossover) and per property while frames are streamed.
+    Memory is constant with respect to the number of frames.
+
+    REFERENCES:
+    1) Welford, B. P. (1962). Note on a method for calculating corrected sums
+        of squares and products. Technometrics, 4(3), 419-420.
+"""
+
+ANGLE_RANGE: Tuple[float, float] = (-180., 180.)
+HIST_RANGE: dict = {
+    "rise": (-10., 10.), "slide": (-10., 10.), "shift": (-10., 10.),
+    "C1'": (0., 25.), "P": (0., 25.),
+    "bp_quality": (-1., 1.), "localres": (0., 20.),
+    "bp_integrity": (0., 1.),
+    "fit_score": (-1., 1.), "motif_score": (-1., 1.),
+}
+
+
+def _hist_range(prop_name: str, feature: Feature) -> Tuple[float, float]:
+    if prop_name in HIST_RANGE:
+        return HIST_RANGE[prop_name]
+    path, _ = feature
+    return HIST_RANGE.get(path[0] if path else None, ANGLE_RANGE)
+
+
+@attr.s
+class RunningStatistics(object):
+    """ Welford accumulator for arrays of shape (keys, features).
+        nan values are ignored. values outside the histogram range are
+        counted in the first or last bin.
+    """
+    shape: Tuple[int, int] = attr.ib()
+    bins: int = attr.ib(default=0)
+    ranges: Optional[np.ndarray] = attr.ib(default=None)
+
+    def __attrs_post_init__(self) -> None:
+        self.count = np.zeros(self.shape, dtype=np.int64)
+        self.mean = np.zeros(self.shape)
+        self.M2 = np.zeros(self.shape)
+        self.min = np.full(self.shape, np.nan)
+        self.max = np.full(self.shape, np.nan)
+        if self.bins:
+            if self.ranges is None:
+                self.ranges = np.tile(ANGLE_RANGE, (self.shape[1], 1))
+            self.hist = np.zeros((*self.shape, self.bins), dtype=np.int64)
+
+    def update(self, values: np.ndarray) -> None:
+        valid = ~np.isnan(values)
+        self.count += valid
+        delta = np.where(valid, values - self.mean, 0.)
+        self.mean += np.divide(delta, self.count,
+                               out=np.zeros(self.shape),
+                               where=valid,
+                               )
+        self.M2 += np.where(valid, delta * (values - self.mean), 0.)
+        self.min = np.fmin(self.min, values)
+        self.max = np.fmax(self.max, values)
+
+        if self.bins:
+            low, high = self.ranges[:, 0], self.ranges[:, 1]
+            scaled = (values - low) / (high - low) * self.bins
+            idx = np.clip(np.floor(np.nan_to_num(scaled)), 0, self.bins - 1)
+            flat = (np.arange(valid.size) * self.bins
+                    + idx.astype(int).ravel())[valid.ravel()]
+            self.hist += np.bincount(flat, minlength=self.hist.size
+                                     ).reshape(self.hist.shape)
+
+    def summary(self) -> Dict[str, Any]:
+        var = np.divide(self.M2, self.count - 1,
+                        out=np.full(self.shape, np.nan),
+                        where=(self.count > 1),
+                        )
+        mean = np.where(self.count > 0, self.mean, np.nan)
+        summary = {"count": self.count,
+                   "mean": mean,
+                   "var": var,
+                   "min": self.min,
+                   "max": self.max,
+                   }
+        if self.bins:
+            summary["hist"] = self.hist
+            summary["edges"] = np.linspace(self.ranges[:, 0],
+                                           self.ranges[:, 1],
+                                           self.bins + 1,
+                                           axis=-1,
+                                           )
+        return summary
+
+
+@attr.s
+class TrajectoryAccumulator(object):
+    """ properties are nested dicts {key: {...}} as produced by BDna.
+        features (leaves of the nested dicts) are fixed by the first frame.
+    """
+    bins: int = attr.ib(default=0)
+
+    def __attrs_post_init__(self) -> None:
+        self.statistics: Dict[str, RunningStatistics] = dict()
+        self.keys: Dict[str, List[Any]] = dict()
+        self.features: Dict[str, List[Feature]] = dict()
+        self.frames: List[int] = list()
+
+    def add(self, prop_name: str, prop: Dict[Any, Any], keys: List[Any],
+            hist_range: Optional[Tuple[float, float]] = None,
+            ) -> None:
+        """ hist_range: histogram range of all features of a new property,
+            default from HIST_RANGE
+        """
+        if prop_name not in self.statistics:
+            features, values = _flatten(prop, keys)
+            ranges = np.array([hist_range or _hist_range(prop_name, f)
+                               for f in features])
+            self.keys[prop_name] = list(keys)
+            self.features[prop_name] = features
+            self.statistics[prop_name] = RunningStatistics(
+                shape=values.shape,
+                bins=self.bins,
+                ranges=ranges.reshape(-1, 2),
+            )
+        else:
+            _, values = _flatten(prop, self.keys[prop_name],
+                                 self.features[prop_name])
+        self.statistics[prop_name].update(values)
+
+    def add_frame(self, frame: int) -> None:
+        self.frames.append(frame)
+
+    def summary(self) -> Dict[str, Any]:
+        summary: Dict[str, Any] = {"frames": self.frames}
+        for prop_name, statistics in self.statistics.items():
+            summary[prop_name] = {"keys": self.keys[prop_name],
+                                  "features": self.features[prop_name],
+                                  **statistics.summary(),
+                                  }
+        return summary
+
+    def dump(self, path: Path) -> None:
+        pickle.dump(self.summary(), open(path, "wb"))
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-3#
+import pickle
+import numpy as np
+import MDAnalysis as mda
+import attr
+
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from bdna import BDna
+from utils import WC_PROPERTIES, DH_ATOMS, UnexpectedCaseError
+
+""" DESCR:
+    per-atom property output of FitAnalyse. Coordinates are stored once per
+    frame (frames, atoms, 3) float32, all properties in one array
+    (frames, atoms, properties) float16 or float32. Both are .npy files that
+    are memory-mapped for writing and reading. export_pdb writes a pdb with
+    one property as tempfactor for a chosen frame.
+
+    COMMENTS:
+    store folder: analysis/{name}__atomprops/
+"""
+
+ATOM_PROPERTIES: List[str] = [*WC_PROPERTIES, "bp", "qual", *DH_ATOMS,
+                              "co_markup", "localres",
+                              ]
+
+
+def residue_properties(bDNA: BDna,
+                       co_markup: "np.ndarray",
+                       localres: Optional[Dict[int, float]] = None,
+                       ) -> "np.ndarray":
+    """ ATOM_PROPERTIES per residue (residues, properties). nan if the
+        property is not evaluated for this residue.
+        wc geometry: mean over the reference points, qual: mean deviation
+    """
+    n_residues = len(bDNA.link.u.residues)
+    values = np.full((n_residues, len(ATOM_PROPERTIES)), np.nan)
+    column = {name: idx for idx, name in enumerate(ATOM_PROPERTIES)}
+
+    for resindex, geometry in bDNA.bp_geometry_local.items():
+        for name in WC_PROPERTIES:
+            values[resindex, column[name]] = np.mean(
+                list(geometry[name].values()))
+    for resindex in range(n_residues):
+        values[resindex, column["bp"]] = float(
+            resindex in bDNA.link.Fbp_full)
+    for resindex, quality in bDNA.bp_quality.items():
+        values[resindex, column["qual"]] = np.mean(list(quality.values()))
+    for resindex, dihedrals in bDNA.dh_quality.items():
+        for name, angle in dihedrals.items():
+            values[resindex, column[name]] = angle
+    values[:, column["co_markup"]] = co_markup
+    if localres is not None:
+        for resindex, value in localres.items():
+            values[resindex, column["localres"]] = value
+    return values
+
+
+@attr.s
+class AtomPropertyWriter(object):
+    path: Path = attr.ib()
+    n_frames: int = attr.ib()
+    u: "mda.universe" = attr.ib()
+    precision: str = attr.ib(default="float32")
+    resume: int = attr.ib(default=0)
+
+    def __attrs_post_init__(self) -> None:
+        """ resume: number of completed frames of a previous run to keep
+        """
+        self.path.mkdir(exist_ok=True)
+        n_atoms = len(self.u.atoms)
+        shapes = {"coordinates": (self.n_frames, n_atoms, 3),
+                  "properties": (self.n_frames, n_atoms, len(ATOM_PROPERTIES)),
+                  }
+        dtypes = {"coordinates": np.float32, "properties": self.precision}
+        mode = "r+" if self.resume else "w+"
+        for name, shape in shapes.items():
+            array = np.lib.format.open_memmap(
+                self.path / "{}.npy".format(name), mode=mode,
+                dtype=dtypes[name], shape=shape,
+            )
+            if array.shape != shape or array.dtype != np.dtype(dtypes[name]):
+                raise UnexpectedCaseError(
+                    "{} in {} does not match run".format(name, self.path))
+            setattr(self, name, array)
+        self.frames: List[int] = list()
+        if self.resume:
+            meta = pickle.load(open(self.path / "meta.p", "rb"))
+            self.frames = meta["frames"][:self.resume]
+
+    def write(self, i: int, values: "np.ndarray",
+              ts: "mda.coordinates.base.Timestep",
+              ) -> None:
+        """ values: properties per residue (residues, properties)
+            ts: timestep of the frame, source of coordinates and frame index
+        """
+        self.coordinates[i] = ts.positions
+        self.properties[i] = values[self.u.atoms.resindices]
+        self.frames.append(ts.frame)
+
+    def flush(self) -> None:
+        self.coordinates.flush()
+        self.properties.flush()
+        meta = {"properties": ATOM_PROPERTIES, "frames": self.frames}
+        pickle.dump(meta, open(self.path / "meta.p", "wb"))
+
+    def close(self) -> None:
+        self.flush()
+
+
+def export_pdb(u: "mda.universe",
+               path: Path,
+               prop: str,
+               frame: int,
+               path_pdb: Path,
+               ) -> None:
+    """ write stored frame (index in store) with prop as tempfactor.
+        negative indices count from the last written frame
+    """
+    meta = pickle.load(open(path / "meta.p", "rb"))
+    if prop not in meta["properties"]:
+        raise UnexpectedCaseError(
+            "property {} not in {}".format(prop, meta["properties"]))
+    n_written = len(meta["frames"])
+    if not -n_written <= frame < n_written:
+        raise UnexpectedCaseError(
+            "frame {} not in the {} written frames".format(frame, n_written))
+    frame = frame % n_written
+    coordinates = np.load(path / "coordinates.npy", mmap_mode="r")
+    properties = np.load(path / "properties.npy", mmap_mode="r")
+    column = meta["properties"].index(prop)
+
+    if not hasattr(u.atoms, "tempfactors"):
+        u.add_TopologyAttr(
+            mda.core.topologyattrs.Tempfactors(np.zeros(len(u.atoms))))
+    u.atoms.positions = coordinates[frame]
+    u.atoms.tempfactors = np.nan_to_num(
+        properties[frame, :, column].astype(np.float32), nan=-1.)
+    with mda.Writer(str(path_pdb)) as pdb:
+        pdb.write(u.atoms)
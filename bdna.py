@@ -2,7 +2,6 @@
 # -*- coding: utf-8 -*-3
 import numpy as np
 import MDAnalysis as mda
-import mrcfile as mrc
 from MDAnalysis.lib import mdamath
 
 import attr
@@ -11,9 +10,11 @@ from typing import Dict, Tuple, Any, Optional, List, Set
 from linker import Linkage
 from basepair import BasePair
 from crossover import Crossover
+from mrcmap import MrcMap
+from integrity import BasePairIntegrity
 from utils import (
     C1P_BASEDIST, WC_HBONDS, WC_HBONDS_DIST, BB_ATOMS,
-    PUR_ATOMS, PYR_ATOMS, DH_ATOMS,
+    PUR_ATOMS, PYR_ATOMS, DH_ATOMS, UnexpectedCaseError,
     _proj, _norm, _v_proj, _save_arccos_deg,
     _dh_angle, _proj2plane
 )
@@ -25,9 +26,49 @@ from utils import (
 """
 
 
+@attr.s(slots=True, frozen=True)
+class Metric(object):
+    """ method: BDna evaluation method
+        requires: structures computed before the method is run
+        properties: BDna attributes filled by the method
+    """
+    method: str = attr.ib()
+    requires: Tuple[str, ...] = attr.ib()
+    properties: Tuple[str, ...] = attr.ib()
+
+
+METRICS: Dict[str, Metric] = {
+    "bp": Metric(method="eval_bp",
+                 requires=("planes",),
+                 properties=("bp_geometry_local",
+                             "bp_geometry_global",
+                             "bp_quality",
+                             ),
+                 ),
+    "distances": Metric(method="eval_distances",
+                        requires=(),
+                        properties=("distances",),
+                        ),
+    "dh": Metric(method="eval_dh",
+                 requires=(),
+                 properties=("dh_quality",),
+                 ),
+    "co_angles": Metric(method="eval_co_angles",
+                        requires=("co_planes",),
+                        properties=("co_angles",),
+                        ),
+    "integrity": Metric(method="eval_bp_integrity",
+                        requires=(),
+                        properties=("bp_integrity",),
+                        ),
+}
+
+
 @attr.s
 class BDna(object):
     link: Linkage = attr.ib()
+    thresholds: List[float] = attr.ib(default=attr.Factory(lambda: [0.1]))
+    integrity: Optional[BasePairIntegrity] = attr.ib(default=None)
 
     def __attrs_post_init__(self) -> None:
         self.bps: Dict[Tuple[int, int], BasePair] = self._get_pot_bp()
@@ -38,15 +79,37 @@ class BDna(object):
         self.dh_quality: Dict[int, Any] = {}
         self.distances: Dict[int, Any] = {}
         self.co_angles: Dict[str, Any] = {}
+        self.bp_integrity: Dict[str, Any] = {}
 
-    def sample(self) -> None:
-        for bp in self.bps.values():
-            bp.calculate_baseplanes()
-
-        self.eval_bp()
-        self.eval_distances()
-        self.eval_dh()
-        self.eval_co_angles()
+    def sample(self, metrics: Optional[List[str]] = None) -> None:
+        """ run the selected metrics (default: all) of METRICS. only the
+            baseplanes required by the selection are computed.
+        """
+        if metrics is None:
+            metrics = list(METRICS)
+        unknown = set(metrics) - set(METRICS)
+        if unknown:
+            raise UnexpectedCaseError("unknown metrics {}".format(unknown))
+
+        requires = {req for name in metrics for req in METRICS[name].requires}
+        if "planes" in requires:
+            for bp in self.bps.values():
+                bp.calculate_baseplanes()
+        if "co_planes" in requires:
+            for bp in self._get_co_bps():
+                bp.calculate_baseplanes()
+
+        for name, metric in METRICS.items():
+            if name in metrics:
+                getattr(self, metric.method)()
+
+    def _get_co_bps(self) -> List[BasePair]:
+        co_bps: Dict[int, BasePair] = dict()
+        for co in self.link.Fco.values():
+            for bp in co.Ps + co.Ls:
+                if bp is not None:
+                    co_bps[id(bp)] = bp
+        return list(co_bps.values())
 
     def _get_bp(self, resindex: int) -> Tuple[Tuple[int, int], BasePair]:
         h, p, is_scaf = self.link.DidDhps[self.link.FidDid[resindex]]
@@ -230,6 +293,18 @@ class BDna(object):
         }
         return geometry
 
+    def eval_bp_integrity(self) -> None:
+        """ classify all basepairs for every deviation threshold at once.
+            pass integrity to reuse the atom index table of another frame
+            Affects
+            -------
+                self.integrity
+                self.bp_integrity
+        """
+        if self.integrity is None:
+            self.integrity = BasePairIntegrity(u=self.link.u, bps=self.bps)
+        self.bp_integrity = self.integrity.classify(self.thresholds)
+
     def eval_dh(self) -> None:
         """ Affects
             -------
@@ -476,39 +551,18 @@ class BDna(object):
                 "resindices": co_data["resindices"],
             }
 
-    def _mrc_localres(self, path_in: str) -> Dict[int, float]:
-        def get_localres(atoms: "mda.atomgroup",
-                         data: np.ndarray,
-                         origin: np.ndarray,
-                         voxel_size: np.ndarray,
-                         ) -> float:
-            locres = 0.
-            for atom in atoms:
-                atom_voxel = np.rint((atom.position - origin) / voxel_size)
-                locres += data[tuple(atom_voxel.astype(int))]
-            locres /= len(atoms)
-            return locres
-
-        self.link.u.trajectory[-1]
-        with mrc.open(path_in, mode='r') as mrc_in:
-            o = np.array(mrc_in.header["origin"])
-            origin = np.array([o["x"], o["y"], o["z"]])
-            c = np.array(mrc_in.header["cella"])
-            cellA = np.array([c["x"], c["y"], c["z"]])
-            shape = np.array([mrc_in.header["nx"],
-                              mrc_in.header["ny"],
-                              mrc_in.header["nz"],
-                              ])
-            voxel_size = cellA / shape
-            data = np.swapaxes(mrc_in.data, 0, 2)
-
-        dict_localres = {}
-        for res in self.link.u.atoms.residues:
-            localres = get_localres(
-                atoms=res.atoms,
-                data=data,
-                origin=origin,
-                voxel_size=voxel_size,
-            )
-            dict_localres[res.resindex] = localres
-        return dict_localres
+    def _mrc_localres(self, mrc_map: MrcMap) -> Dict[int, float]:
+        """ mean map value at the voxels of the atoms of each residue at the
+            current frame. only the voxels touched by atoms are read from the
+            map, a binned map is binned once on first access.
+        """
+        atoms = self.link.u.atoms
+        values = mrc_map.values(atoms.positions)
+
+        n_residues = len(self.link.u.residues)
+        locres_sum = np.bincount(atoms.resindices, weights=values,
+                                 minlength=n_residues)
+        n_atoms = np.bincount(atoms.resindices, minlength=n_residues)
+        localres = locres_sum / n_atoms
+        return {res.resindex: localres[res.resindex]
+                for res in self.link.u.residues}
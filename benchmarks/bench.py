@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-3#
+import sys
+import json
+import time
+import argparse
+import tempfile
+import numpy as np
+
+from pathlib import Path
+from typing import Callable, Dict, List, Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from synthetic import generate, SyntheticLinker, synthetic_project  # noqa
+from bdna import BDna  # noqa: E402
+from segmentation import mrc_segment  # noqa: E402
+from mrcmap import MrcMap  # noqa: E402
+from elastic_network import ElaticNetwortModifier  # noqa: E402
+
+__descr__ = """
+    benchmark suite on synthetic DNA-Origami of increasing size.
+    times Linker.create_linkage, BDna.sample, mrc_segment and
+    ElaticNetwortModifier for every size and reports the scaling exponent
+    (slope of log(time) over log(number of nucleotides)).
+    runs offline, all inputs are generated in a temporary folder.
+"""
+
+SUBSYSTEMS: List[str] = ["linkage", "bdna", "segment", "elastic_network"]
+
+
+def best_of(function: Callable[[], Any], repeat: int) -> float:
+    """ minimum wall time [s] of repeat calls
+    """
+    timings = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def bench_size(folder: Path, n_helices: int, length: int, repeat: int,
+               segment_fraction: float) -> Dict[str, float]:
+    name = "syn{}x{}".format(n_helices, length)
+    origami = generate(folder=folder, name=name, n_helices=n_helices,
+                       length=length, n_frames=1)
+    project = synthetic_project(folder=folder, name=name, EN="11111110")
+    project.output.mkdir(exist_ok=True)
+
+    def linkage() -> None:
+        SyntheticLinker(project=project, origami=origami).create_linkage()
+
+    linker = SyntheticLinker(project=project, origami=origami)
+    link = linker.create_linkage()
+
+    def bdna() -> None:
+        BDna(link).sample()
+
+    n_segment = max(int(len(link.u.residues) * segment_fraction), 1)
+    atoms = link.u.residues[:n_segment].atoms
+
+    def segment() -> None:
+        with MrcMap(folder / "{}.mrc".format(name)) as mrc_map:
+            mrc_segment(atoms=atoms,
+                        mrc_map=mrc_map,
+                        path_out=project.output / "{}-bench.mrc".format(
+                            name),
+                        context=project.context,
+                        )
+
+    def elastic_network() -> None:
+        ElaticNetwortModifier(linker).write_en()
+
+    timings = {"n_helices": n_helices,
+               "length": length,
+               "n_nucleotides": len(link.u.residues),
+               "n_atoms": len(link.u.atoms),
+               }
+    functions = {"linkage": linkage,
+                 "bdna": bdna,
+                 "segment": segment,
+                 "elastic_network": elastic_network,
+                 }
+    for subsystem in SUBSYSTEMS:
+        timings[subsystem] = best_of(functions[subsystem], repeat=repeat)
+    return timings
+
+
+def scaling(results: List[Dict[str, float]]) -> Dict[str, float]:
+    """ exponent of a power law fit time ~ n_nucleotides^k
+    """
+    n = np.array([r["n_nucleotides"] for r in results], dtype=float)
+    exponents = dict()
+    for subsystem in SUBSYSTEMS:
+        t = np.array([r[subsystem] for r in results])
+        if len(n) < 2:
+            exponents[subsystem] = np.nan
+        else:
+            exponents[subsystem] = np.polyfit(np.log(n), np.log(t), 1)[0]
+    return exponents
+
+
+def report(results: List[Dict[str, float]], exponents: Dict[str, float]
+           ) -> str:
+    header = "{:>8} {:>8}".format("nt", "atoms") + "".join(
+        " {:>16}".format(s) for s in SUBSYSTEMS)
+    lines = [header]
+    for r in results:
+        lines.append("{:>8} {:>8}".format(r["n_nucleotides"], r["n_atoms"])
+                     + "".join(" {:>15.4f}s".format(r[s])
+                               for s in SUBSYSTEMS))
+    lines.append("{:>17}".format("scaling n^k") + "".join(
+        " {:>16.2f}".format(exponents[s]) for s in SUBSYSTEMS))
+    return "\n".join(lines)
+
+
+def plot(results: List[Dict[str, float]], path: Path) -> None:
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    n = [r["n_nucleotides"] for r in results]
+    fig, ax = plt.subplots()
+    for subsystem in SUBSYSTEMS:
+        ax.loglog(n, [r[subsystem] for r in results], "o-", label=subsystem)
+    ax.set_xlabel("nucleotides")
+    ax.set_ylabel("time [s]")
+    ax.legend()
+    fig.savefig(path)
+
+
+def proc_input() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=__descr__,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--helices",
+                        help="number of helices per benchmark size",
+                        type=int,
+                        nargs="+",
+                        default=[2, 4, 8, 16],
+                        )
+    parser.add_argument("--length",
+                        help="helix length [bp], multiple of 32, not of 21",
+                        type=int,
+                        default=64,
+                        )
+    parser.add_argument("--repeat",
+                        help="timing repetitions, best is reported",
+                        type=int,
+                        default=3,
+                        )
+    parser.add_argument("--segment-fraction",
+                        help="fraction of residues segmented",
+                        type=float,
+                        default=0.1,
+                        )
+    parser.add_argument("--folder",
+                        help="keep generated inputs in folder",
+                        type=str,
+                        default=None,
+                        )
+    parser.add_argument("--json",
+                        help="write results to json file",
+                        type=str,
+                        default=None,
+                        )
+    parser.add_argument("--plot",
+                        help="write log-log scaling plot (needs matplotlib)",
+                        type=str,
+                        default=None,
+                        )
+    return parser.parse_args()
+
+
+def main():
+    args = proc_input()
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(args.folder) if args.folder else Path(tmp)
+        results = list()
+        for n_helices in args.helices:
+            print("benchmark {} helices x {} bp".format(n_helices,
+                                                        args.length))
+            results.append(bench_size(folder=folder,
+                                      n_helices=n_helices,
+                                      length=args.length,
+                                      repeat=args.repeat,
+                                      segment_fraction=args.segment_fraction,
+                                      ))
+    exponents = scaling(results)
+    print(report(results, exponents))
+
+    if args.json is not None:
+        with open(args.json, "w") as json_out:
+            json.dump({"results": results, "scaling": exponents}, json_out,
+                      indent=2)
+    if args.plot is not None:
+        plot(results, Path(args.plot))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,470 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-3#
+import sys
+import attr
+import json
+import numpy as np
+import MDAnalysis as mda
+import mrcfile as mrc
+
+from pathlib import Path
+from typing import Dict, List, Tuple, Optional, Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from project import Project  # noqa: E402
+from fit import Fit  # noqa: E402
+from linker import Linker  # noqa: E402
+from mrcmap import MrcMap  # noqa: E402
+from modelmap import ModelMap  # noqa: E402
+
+""" DESCR:
+    generator for synthetic DNA-Origami inputs of configurable size:
+    cadnano-style design [name.json, name.seq], ideal B-DNA atomic model
+    [name.psf, name.dcd], matching density maps [name.mrc, halfmaps,
+    localres] and elastic network [name.exb].
+    SyntheticLinker links the generated files without nanodesign.
+
+    COMMENTS:
+    square lattice, one row of helices. the scaffold snakes through all
+    helices, staples are 16 nt domains with crossovers to alternating
+    neighbouring helices. geometry is approximate but complete for all
+    atoms evaluated by BDna.
+"""
+
+RISE: float = 3.38
+TWIST: float = 360. / 10.67
+HELIX_SPACING: float = 25.
+BLOCK: int = 16
+SEQ_WC: dict = {"A": "T", "T": "A", "G": "C", "C": "G"}
+RESNAMES: dict = {"A": "ADE", "T": "THY", "G": "GUA", "C": "CYT"}
+MASSES: dict = {"C": 12.011, "N": 14.007, "O": 15.999, "P": 30.974}
+# backbone: cylindrical coordinates (r [A], phi [deg], z [A])
+BACKBONE: dict = {
+    "P": (8.9, 95., -2.1), "O1P": (10.2, 92., -2.3),
+    "O2P": (8.8, 88., -3.2), "O5'": (7.6, 100., -1.7),
+    "C5'": (7.7, 108., -2.1), "C4'": (7.8, 115., -1.2),
+    "O4'": (6.4, 113., -0.6), "C3'": (8.4, 119., 0.),
+    "O3'": (8.6, 127., 0.6), "C2'": (7.2, 122., 0.5),
+    "C1'": (5.9, 115., 0.),
+}
+# bases: in-plane cartesian coordinates (x, y) [A]
+PURINE: dict = {
+    "N9": (-1.7, 4.2), "C8": (-0.6, 5.0), "N7": (0.6, 4.5),
+    "C5": (0.5, 3.2), "C6": (1.3, 2.3), "N1": (-0.3, 1.44),
+    "C2": (-1.3, 2.0), "N3": (-2.0, 2.9), "C4": (-0.8, 3.2),
+}
+PYRIMIDINE: dict = {
+    "N1": (-1.5, 4.0), "C2": (-1.5, 2.6), "N3": (-0.3, 1.44),
+    "C4": (0.9, 2.2), "C5": (0.9, 3.5), "C6": (-0.3, 4.3),
+}
+BASES: dict = {
+    "ADE": {**PURINE, "N6": (1.5, 1.475)},
+    "GUA": {**PURINE, "N1": (-0.3, 1.425), "O6": (1.5, 1.425),
+            "N2": (-2.0, 1.425)},
+    "THY": {**PYRIMIDINE, "O4": (1.5, 1.475), "O2": (-2.4, 2.0),
+            "C5M": (2.0, 4.0)},
+    "CYT": {**PYRIMIDINE, "N3": (-0.3, 1.425), "N4": (1.5, 1.425),
+            "O2": (-2.0, 1.425)},
+}
+HBOND_EXB: dict = {"ADE": "N1", "GUA": "N1", "THY": "N3", "CYT": "N3"}
+
+
+def _template(resname: str, is_ter5: bool) -> Tuple[List[str], np.ndarray]:
+    names, xyz = list(), list()
+    for name, (r, phi, z) in BACKBONE.items():
+        if is_ter5 and name in ["P", "O1P", "O2P"]:
+            continue
+        names.append(name)
+        phi = np.deg2rad(phi)
+        xyz.append((r * np.cos(phi), r * np.sin(phi), z))
+    for name, (x, y) in BASES[resname].items():
+        names.append(name)
+        xyz.append((x, y, 0.))
+    return names, np.array(xyz)
+
+
+@attr.s(slots=True, cmp=False)
+class SyntheticBase(object):
+    """ stand-in for nanodesign DnaBase
+    """
+    id: int = attr.ib()
+    h: int = attr.ib()
+    p: int = attr.ib()
+    is_scaf: bool = attr.ib()
+    strand: int = attr.ib()
+    seq: str = attr.ib(default="N")
+    up: Optional["SyntheticBase"] = attr.ib(default=None)
+    down: Optional["SyntheticBase"] = attr.ib(default=None)
+    across: Optional["SyntheticBase"] = attr.ib(default=None)
+
+
+@attr.s(slots=True)
+class SyntheticHelix(object):
+    id: int = attr.ib()
+    lattice_row: int = attr.ib()
+    lattice_col: int = attr.ib()
+    load_order: int = attr.ib()
+
+
+@attr.s(slots=True)
+class SyntheticStrand(object):
+    tour: List[SyntheticBase] = attr.ib()
+    is_scaffold: bool = attr.ib()
+    icolor: int = attr.ib(default=0)
+
+
+@attr.s(slots=True)
+class SyntheticDomain(object):
+    id: int = attr.ib()
+    base_list: List[SyntheticBase] = attr.ib()
+    connected_domain: int = attr.ib(default=-1)
+
+
+@attr.s
+class SyntheticOrigami(object):
+    """ routing of a square lattice origami with n_helices x length bases.
+        exposes the attributes of Design (design.py) used by the Linker.
+    """
+    n_helices: int = attr.ib(default=4)
+    length: int = attr.ib(default=64)
+    seed: int = attr.ib(default=0)
+
+    def __attrs_post_init__(self) -> None:
+        # cadnano 2 json has no lattice type, readers infer it from the
+        # helix length: multiples of 21 (honeycomb period) read as honeycomb
+        if self.length % (2 * BLOCK) or self.length % 21 == 0:
+            raise ValueError(
+                "length has to be a multiple of 32 and not of 21, else the "
+                "square lattice design is read as honeycomb")
+        self.rng = np.random.default_rng(self.seed)
+        self.design = self
+        self.strands: List[SyntheticStrand] = list()
+        self.structure_helices_map: Dict[int, SyntheticHelix] = {
+            h: SyntheticHelix(id=h, lattice_row=0, lattice_col=h,
+                              load_order=h)
+            for h in range(self.n_helices)
+        }
+        self.structure_helices_coord_map = {
+            (H.lattice_row, H.lattice_col): H
+            for H in self.structure_helices_map.values()
+        }
+        self.Dhp_skips: set = set()
+        self._route()
+        self.scaffold = [s.tour for s in self.strands if s.is_scaffold][0]
+        self.staples = [s.tour for s in self.strands if not s.is_scaffold]
+        self.allbases = [b for s in self.strands for b in s.tour]
+        self.Dhps_base = {(b.h, b.p, b.is_scaf): b for b in self.allbases}
+        self.helixorder = {h: h for h in range(self.n_helices)}
+        self.stapleorder = self._create_staple_order()
+        self.domain_list = self._create_domains()
+
+    def _scaffold_path(self) -> List[Tuple[int, int]]:
+        path = list()
+        for h in range(self.n_helices):
+            positions = range(self.length)
+            path += [(h, p) for p in (positions if h % 2 == 0
+                                      else reversed(positions))]
+        return path
+
+    def _staple_paths(self) -> List[List[Tuple[int, int]]]:
+        def run(h: int, start: int) -> List[Tuple[int, int]]:
+            # staples run 3'->5' with increasing position on even helices
+            block = range(start, start + BLOCK)
+            return [(h, p) for p in (reversed(block) if h % 2 == 0
+                                     else block)]
+
+        paths = list()
+        for k in range(self.length // BLOCK):
+            start = k * BLOCK
+            h = k % 2
+            if h == 1:
+                paths.append(run(0, start))
+            while h < self.n_helices:
+                if h + 1 < self.n_helices:
+                    paths.append(run(h, start) + run(h + 1, start))
+                else:
+                    paths.append(run(h, start))
+                h += 2
+        return paths
+
+    def _route(self) -> None:
+        scaffold_seq = "".join(self.rng.choice(list("ATGC"),
+                                               self.n_helices * self.length))
+        self.sequence = scaffold_seq
+        paths = [self._scaffold_path()] + self._staple_paths()
+        hp_scaf: Dict[Tuple[int, int], SyntheticBase] = dict()
+        base_id = 0
+        for idx, path in enumerate(paths):
+            is_scaf = (idx == 0)
+            tour = list()
+            for h, p in path:
+                base = SyntheticBase(id=base_id, h=h, p=p, is_scaf=is_scaf,
+                                     strand=idx)
+                base_id += 1
+                if is_scaf:
+                    base.seq = scaffold_seq[len(tour)]
+                    hp_scaf[(h, p)] = base
+                else:
+                    base.across = hp_scaf[(h, p)]
+                    base.across.across = base
+                    base.seq = SEQ_WC[base.across.seq]
+                if tour:
+                    tour[-1].down = base
+                    base.up = tour[-1]
+                tour.append(base)
+            self.strands.append(SyntheticStrand(
+                tour=tour, is_scaffold=is_scaf, icolor=idx))
+
+    def _create_staple_order(self) -> Dict[int, int]:
+        Dhps = [(self.helixorder[s[0].h], s[0].p) for s in self.staples]
+        Dhps_sorted = sorted(Dhps)
+        return {nd: Dhps_sorted.index(hp) for nd, hp in enumerate(Dhps)}
+
+    def _create_domains(self) -> List[SyntheticDomain]:
+        domains: List[SyntheticDomain] = list()
+        base_domain: Dict[int, int] = dict()
+        for strand in self.strands:
+            current: List[SyntheticBase] = list()
+            for base in strand.tour:
+                if current and (base.h != current[-1].h
+                                or (base.across is not None
+                                    and base.across.strand
+                                    != current[-1].across.strand)):
+                    domains.append(SyntheticDomain(id=len(domains),
+                                                   base_list=current))
+                    current = list()
+                current.append(base)
+            domains.append(SyntheticDomain(id=len(domains),
+                                           base_list=current))
+        for domain in domains:
+            for base in domain.base_list:
+                base_domain[base.id] = domain.id
+        for domain in domains:
+            across = domain.base_list[0].across
+            if across is not None:
+                domain.connected_domain = base_domain[across.id]
+        return domains
+
+    def write_design(self, path: Path) -> None:
+        """ cadnano 2 json and scaffold sequence file
+        """
+        vstrands = list()
+        for h in range(self.n_helices):
+            vstrands.append({
+                "num": h, "row": 0, "col": h,
+                "scaf": [[-1, -1, -1, -1] for _ in range(self.length)],
+                "stap": [[-1, -1, -1, -1] for _ in range(self.length)],
+                "loop": [0] * self.length, "skip": [0] * self.length,
+                "scafLoop": [], "stapLoop": [], "stap_colors": [],
+            })
+        for strand in self.strands:
+            key = "scaf" if strand.is_scaffold else "stap"
+            for base in strand.tour:
+                up, down = base.up, base.down
+                vstrands[base.h][key][base.p] = [
+                    up.h if up else -1, up.p if up else -1,
+                    down.h if down else -1, down.p if down else -1,
+                ]
+            if not strand.is_scaffold:
+                start = strand.tour[0]
+                vstrands[start.h]["stap_colors"].append(
+                    [start.p, 13369344 + strand.icolor])
+        design = {"name": path.name, "vstrands": vstrands}
+        with open(path.with_suffix(".json"), mode="w") as json_out:
+            json.dump(design, json_out)
+        with open(path.with_suffix(".seq"), mode="w") as seq_out:
+            seq_out.write(self.sequence)
+
+    def _segments(self) -> List[Tuple[str, List[SyntheticBase]]]:
+        segments = [("SCAF", self.scaffold)]
+        order = sorted(self.stapleorder.items(), key=lambda x: x[1])
+        # zero padded: MDAnalysis orders segments by segid
+        width = len(str(len(order)))
+        for nd, enrg in order:
+            segments.append(("S{:0{}d}".format(enrg, width),
+                             self.staples[nd]))
+        return segments
+
+    def atoms(self) -> Tuple[List[Tuple[str, int, str, str]], np.ndarray]:
+        """ ideal B-DNA model. segments are ordered like enrgMD output.
+        -------
+         Returns
+            -------
+            atom records (segid, resid, resname, name), positions
+        """
+        records, positions = list(), list()
+        templates: Dict[Tuple[str, bool], Tuple[List[str], np.ndarray]] = {}
+        for segid, tour in self._segments():
+            for resid, base in enumerate(tour, start=1):
+                resname = RESNAMES[base.seq]
+                is_ter5 = base.up is None
+                key = (resname, is_ter5)
+                if key not in templates:
+                    templates[key] = _template(resname, is_ter5)
+                names, xyz = templates[key]
+                # strand running +z uses template, -z its dyad image
+                is_forward = (base.h % 2 == 0) == base.is_scaf
+                if not is_forward:
+                    xyz = xyz * np.array([1., -1., -1.])
+                phi = np.deg2rad(base.p * TWIST)
+                rot = np.array([[np.cos(phi), -np.sin(phi), 0.],
+                                [np.sin(phi), np.cos(phi), 0.],
+                                [0., 0., 1.]])
+                shift = np.array([base.h * HELIX_SPACING, 0.,
+                                  base.p * RISE])
+                positions.append(xyz @ rot.T + shift)
+                records += [(segid, resid, resname, name) for name in names]
+        return records, np.concatenate(positions).astype(np.float32)
+
+
+def write_psf(path: Path, records: List[Tuple[str, int, str, str]]) -> None:
+    with open(path, mode="w") as psf:
+        psf.write("PSF NAMD\n\n       1 !NTITLE\n REMARKS synthetic\n\n")
+        psf.write("{:8d} !NATOM\n".format(len(records)))
+        for idx, (segid, resid, resname, name) in enumerate(records, 1):
+            psf.write("{:8d} {} {} {} {} {} {:10.6f} {:10.4f} 0\n".format(
+                idx, segid, resid, resname, name, name[0], 0.,
+                MASSES[name[0]]))
+        for section in ["NBOND: bonds", "NTHETA: angles",
+                        "NPHI: dihedrals", "NIMPHI: impropers"]:
+            psf.write("\n{:8d} !{}\n".format(0, section))
+
+
+def write_dcd(path: Path, psf: Path, positions: np.ndarray,
+              n_frames: int, noise: float, rng: np.random.Generator
+              ) -> "mda.Universe":
+    u = mda.Universe(str(psf), positions[None, :, :], format="MEMORY")
+    with mda.Writer(str(path), n_atoms=len(positions)) as dcd:
+        for _ in range(n_frames):
+            u.atoms.positions = (
+                positions + rng.normal(0., noise, positions.shape))
+            dcd.write(u.atoms)
+    return u
+
+
+def _smooth(data: np.ndarray, sigma: float) -> np.ndarray:
+    """ gaussian filter (sigma in voxel) with periodic boundary via fft
+    """
+    k2 = sum(np.meshgrid(*[np.fft.fftfreq(n)**2 for n in data.shape[:-1]],
+                         np.fft.rfftfreq(data.shape[-1])**2,
+                         indexing="ij"))
+    kernel = np.exp(-2. * (np.pi * sigma)**2 * k2)
+    axes = tuple(range(data.ndim))
+    return np.fft.irfftn(np.fft.rfftn(data) * kernel, s=data.shape,
+                         axes=axes)
+
+
+def write_maps(path: Path, atoms: "mda.AtomGroup", voxel_size: float,
+               resolution: float, rng: np.random.Generator) -> None:
+    """ model density of the atoms (ModelMap), two noisy halfmaps and a
+        localres map
+    """
+    positions = atoms.positions
+    margin = 3. * resolution
+    origin = positions.min(axis=0) - margin
+    shape = np.ceil((positions.max(axis=0) + margin - origin)
+                    / voxel_size).astype(int)
+    path_map = path.parent / "{}.mrc".format(path.name)
+    with mrc.new(str(path_map), overwrite=True) as mrc_out:
+        mrc_out.set_data(np.zeros(shape[::-1], dtype=np.float32))
+        mrc_out.voxel_size = voxel_size
+        mrc_out.header["origin"] = tuple(origin)
+    with MrcMap(path_map) as grid:
+        model = ModelMap(mrc_map=grid, resolution=resolution)
+        density, _ = model.simulate(atoms=atoms,
+                                    low=np.zeros(3, dtype=int),
+                                    high=grid.shape,
+                                    )
+    density /= density.max()
+
+    localres = _smooth(rng.normal(0., 1., density.shape), 4.)
+    localres = 6. + localres / (np.abs(localres).max() + 1e-6)
+    noise = 0.1 * density.std()
+    maps = {
+        "": density,
+        "-segment": density,
+        "_unfil_half1": density + rng.normal(0., noise, density.shape),
+        "_unfil_half2": density + rng.normal(0., noise, density.shape),
+        "_localres": localres,
+    }
+    for suffix, data in maps.items():
+        out = path.parent / "{}{}.mrc".format(path.name, suffix)
+        with mrc.new(str(out), overwrite=True) as mrc_out:
+            mrc_out.set_data(data.astype(np.float32))
+            mrc_out.voxel_size = voxel_size
+            mrc_out.header["origin"] = tuple(origin)
+
+
+def write_exb(path: Path, u: "mda.Universe", origami: SyntheticOrigami
+              ) -> None:
+    """ enrgMD style extrabonds: H-bonds, stacking and long range bonds
+    """
+    def atom_index(segid: str, resid: int, name: str) -> int:
+        return seg_res[(segid, resid)][name]
+
+    seg_res: Dict[Tuple[str, int], Dict[str, int]] = dict()
+    for atom in u.atoms:
+        seg_res.setdefault((atom.segid, atom.resid), {})[atom.name] = atom.ix
+    base_res: Dict[int, Tuple[str, int]] = dict()
+    for segid, tour in origami._segments():
+        for resid, base in enumerate(tour, start=1):
+            base_res[base.id] = (segid, resid)
+
+    with open(path.with_suffix(".exb"), mode="w") as exb:
+        for base in origami.scaffold:
+            seg_res_sc = base_res[base.id]
+            name_sc = HBOND_EXB[RESNAMES[base.seq]]
+            if base.across is not None:
+                seg_res_st = base_res[base.across.id]
+                name_st = HBOND_EXB[RESNAMES[base.across.seq]]
+                exb.write("bond {} {} 1.0 2.88\n".format(
+                    atom_index(*seg_res_sc, name_sc),
+                    atom_index(*seg_res_st, name_st)))
+            if base.down is not None:
+                exb.write("bond {} {} 0.5 {:.2f}\n".format(
+                    atom_index(*seg_res_sc, "C1'"),
+                    atom_index(*base_res[base.down.id], "C1'"), 5.5))
+            if base.p % BLOCK == 0 and base.h + 1 < origami.n_helices:
+                other = origami.Dhps_base[(base.h + 1, base.p, True)]
+                exb.write("bond {} {} 0.1 {:.2f}\n".format(
+                    atom_index(*seg_res_sc, "C1'"),
+                    atom_index(*base_res[other.id], "C1'"), HELIX_SPACING))
+
+
+def generate(folder: Path, name: str, n_helices: int = 4, length: int = 64,
+             n_frames: int = 2, voxel_size: float = 2.,
+             resolution: float = 6., seed: int = 0,
+             ) -> SyntheticOrigami:
+    """ write all input files of a synthetic design to folder/name.*
+    """
+    folder.mkdir(parents=True, exist_ok=True)
+    path = folder / name
+    rng = np.random.default_rng(seed)
+    origami = SyntheticOrigami(n_helices=n_helices, length=length, seed=seed)
+    origami.write_design(path)
+    records, positions = origami.atoms()
+    write_psf(path.with_suffix(".psf"), records)
+    u = write_dcd(path.with_suffix(".dcd"), path.with_suffix(".psf"),
+                  positions, n_frames=n_frames, noise=0.2, rng=rng)
+    u.atoms.positions = positions
+    write_maps(path, u.atoms, voxel_size=voxel_size,
+               resolution=resolution, rng=rng)
+    write_exb(path, u, origami)
+    return origami
+
+
+@attr.s
+class SyntheticLinker(Linker):
+    """ Linker that uses the generated routing instead of nanodesign
+    """
+    origami: SyntheticOrigami = attr.ib(default=None)
+
+    def __attrs_post_init__(self) -> None:
+        self.fit: Fit = Fit(self.project)
+        self.design: Any = self.origami
+        self.Dhp_skips = self.origami.Dhp_skips
+
+
+def synthetic_project(folder: Path, name: str, **kwargs: Any) -> Project:
+    return Project(input=folder, output=folder / "analysis", name=name,
+                   **kwargs)
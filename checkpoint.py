@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-3#
+import os
+import pickle
+import attr
+
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+from accumulator import TrajectoryAccumulator
+from utils import UnexpectedCaseError
+
+""" DESCR:
+    Checkpoint Class records the progress of a FitAnalyse run: the selected
+    frames, the number of completed frames and the state of the running
+    statistics. A run restarted with --resume continues after the last
+    completed frame.
+
+    COMMENTS:
+    checkpoint file: analysis/{name}__checkpoint.p
+    the file is replaced atomically. outputs (store, atomprops) are flushed
+    before the checkpoint is written, frames beyond "completed" are redone.
+"""
+
+
+@attr.s
+class Checkpoint(object):
+    path: Path = attr.ib()
+    run: Dict[str, Any] = attr.ib()
+    every: int = attr.ib(default=10)
+
+    def __attrs_post_init__(self) -> None:
+        self.completed: int = 0
+        self.accumulator: Optional[TrajectoryAccumulator] = None
+
+    def resume(self) -> int:
+        """ load previous checkpoint if present and compatible.
+            Returns
+            -------
+                number of completed frames
+        """
+        if not self.path.exists():
+            print("no checkpoint found, start from first frame")
+            return self.completed
+
+        checkpoint = pickle.load(open(self.path, "rb"))
+        for key, value in self.run.items():
+            if checkpoint["run"].get(key, None) != value:
+                raise UnexpectedCaseError(
+                    "checkpoint {} differs in {}".format(self.path, key))
+        self.completed = checkpoint["completed"]
+        self.accumulator = checkpoint["accumulator"]
+        print("resume after {} completed frames".format(self.completed))
+        return self.completed
+
+    def is_due(self, completed: int, n_frames: int) -> bool:
+        return (completed % max(self.every, 1) == 0) or completed == n_frames
+
+    def save(self, completed: int,
+             accumulator: Optional[TrajectoryAccumulator] = None,
+             ) -> None:
+        self.completed = completed
+        self.accumulator = accumulator
+        checkpoint = {"run": self.run,
+                      "completed": self.completed,
+                      "accumulator": self.accumulator,
+                      }
+        path_tmp = self.path.with_suffix(".tmp")
+        with open(path_tmp, "wb") as f:
+            pickle.dump(checkpoint, f)
+        os.replace(path_tmp, self.path)
+
+
+def run_signature(frames: List[int], link_hash: str, metrics: List[str],
+                  thresholds: List[float], **options: Any) -> Dict[str, Any]:
+    """ everything that has to match for a run to be resumed
+    """
+    return {"frames": list(frames),
+            "linkage": link_hash,
+            "metrics": list(metrics),
+            "thresholds": list(thresholds),
+            **options,
+            }
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-3#
+import numpy as np
+import MDAnalysis as mda
+import attr
+
+from typing import Dict, Iterable, Iterator, Tuple, Optional
+
+from mrcmap import MrcMap
+from modelmap import ModelMap, SIGMA_FACTOR
+
+""" DESCR:
+    FitScore Class scores the fit of an atomic model to a cryo-EM map per
+    residue and per motif:
+        cc: correlation of map and model map (ModelMap) over the voxels
+            within radius of the atoms of a residue
+        q: Q-score-like correlation of the map values around each atom with
+            a gaussian reference profile, averaged per residue
+    map and model values are gathered for all atoms at once with a
+    precomputed neighbourhood of voxel offsets.
+
+    COMMENTS:
+    voxels shared by atoms of one residue are counted once. motif scores are
+    computed from the summed residue moments, voxels shared by residues of a
+    motif are counted for every residue.
+
+    REFERENCES:
+    1) Pintilie, G. et al. (2020). Measurement of atom resolvability in
+        cryo-EM maps with Q-scores. Nature Methods, 17(3), 328-334.
+"""
+
+# sums of x, y, xy, xx, yy, n per residue
+N_MOMENTS: int = 6
+
+
+def _cc_from_moments(moments: np.ndarray) -> np.ndarray:
+    """ pearson correlation from moments (..., N_MOMENTS), nan if undefined
+    """
+    sx, sy, sxy, sxx, syy, n = np.moveaxis(moments, -1, 0)
+    cov = n * sxy - sx * sy
+    var = (n * sxx - sx**2) * (n * syy - sy**2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(var > 0., cov / np.sqrt(np.abs(var)), np.nan)
+
+
+def _unique(values: np.ndarray) -> np.ndarray:
+    """ sorted unique values, sorts in place
+    """
+    values.sort()
+    keep = np.ones(len(values), dtype=bool)
+    keep[1:] = values[1:] != values[:-1]
+    return values[keep]
+
+
+@attr.s
+class FitScore(object):
+    mrc_map: MrcMap = attr.ib()
+    resolution: float = attr.ib(default=6.)
+    radius: Optional[float] = attr.ib(default=None)
+    chunk: int = attr.ib(default=100000)
+
+    def __attrs_post_init__(self) -> None:
+        """ radius: neighbourhood radius [A], default resolution / 2
+        """
+        if self.radius is None:
+            self.radius = 0.5 * self.resolution
+        self.model: ModelMap = ModelMap(mrc_map=self.mrc_map,
+                                        resolution=self.resolution,
+                                        )
+        self.sigma: float = SIGMA_FACTOR * self.resolution
+        self.offsets: np.ndarray = self._offsets()
+        self.offsets_d2: np.ndarray = np.sum(
+            (self.offsets * self.mrc_map.voxel_size)**2, axis=1)
+
+    def _offsets(self) -> np.ndarray:
+        """ voxel offsets (x, y, z) within radius of a voxel
+        """
+        voxel_size = self.mrc_map.voxel_size
+        v_radius = np.ceil(self.radius / voxel_size).astype(int)
+        grid = np.stack(np.meshgrid(*[np.arange(-v, v + 1) for v in v_radius],
+                                    indexing="ij",
+                                    ), axis=-1).reshape(-1, 3)
+        distance = np.linalg.norm(grid * voxel_size, axis=1)
+        return grid[distance <= self.radius]
+
+    def _chunks(self, n: int) -> Iterator[slice]:
+        for start in range(0, n, self.chunk):
+            yield slice(start, min(start + self.chunk, n))
+
+    def score(self, atoms: "mda.AtomGroup") -> Dict[str, np.ndarray]:
+        """ scores of the residues of atoms at their current positions
+            Returns
+            -------
+                cc, q (n_residues,), nan for residues without atoms
+                moments (n_residues, N_MOMENTS) for motif aggregation
+        """
+        n_residues = len(atoms.universe.residues)
+        positions = atoms.positions
+        resindices = atoms.resindices
+
+        model, low = self.model.simulate(atoms=atoms)
+        high = low + np.array(model.shape[::-1])
+        experiment = self.mrc_map.subvolume(low=low, high=high)
+        shape = np.array(model.shape)  # (z, y, x)
+        model, experiment = model.ravel(), experiment.ravel()
+
+        # neighbourhood as flat offsets, only atoms at the box border need
+        # an explicit inside test
+        strides = np.array([shape[1] * shape[2], shape[2], 1])
+        offsets_flat = self.offsets[:, ::-1] @ strides
+        v_radius = np.abs(self.offsets).max(axis=0)
+        shape_xyz = shape[::-1]
+
+        voxel_size = self.mrc_map.voxel_size
+        voxels = self.mrc_map.voxels(positions) - low
+        # voxel center - position [A]
+        delta = (voxels + low) * voxel_size - (positions - self.mrc_map.origin)
+
+        voxel_res, q_sum = list(), np.zeros(n_residues)
+        for part in self._chunks(len(atoms)):
+            v = voxels[part]
+            flat = (v[:, ::-1] @ strides)[:, np.newaxis] + offsets_flat
+            inside = np.ones(flat.shape, dtype=bool)
+            border = np.any((v < v_radius) | (v >= shape_xyz - v_radius),
+                            axis=1)
+            if np.any(border):
+                neighbours = v[border, np.newaxis, :] + self.offsets
+                inside[border] = np.all((neighbours >= 0)
+                                        & (neighbours < shape_xyz), axis=-1)
+                flat[~inside] = 0
+
+            # q: map values around each atom vs gaussian reference profile
+            d = delta[part]
+            d2 = (self.offsets_d2
+                  + 2. * d @ (self.offsets * voxel_size).T
+                  + np.sum(d**2, axis=1)[:, np.newaxis]
+                  )
+            reference = np.exp(-0.5 * d2 / self.sigma**2) * inside
+            values = experiment[flat] * inside
+            q = _cc_from_moments(np.stack([
+                np.sum(values, axis=1),
+                np.sum(reference, axis=1),
+                np.sum(values * reference, axis=1),
+                np.sum(values**2, axis=1),
+                np.sum(reference**2, axis=1),
+                np.sum(inside, axis=1),
+            ], axis=-1))
+            q_sum += np.bincount(resindices[part], weights=np.nan_to_num(q),
+                                 minlength=n_residues)
+
+            res = np.broadcast_to(resindices[part, np.newaxis], flat.shape)
+            voxel_res.append(res[inside] * model.size + flat[inside])
+
+        # cc: unique voxels per residue
+        voxel_res = _unique(np.concatenate(voxel_res))
+        res, flat = np.divmod(voxel_res, model.size)
+        x, y = experiment[flat].astype(float), model[flat].astype(float)
+        moments = np.stack([
+            np.bincount(res, weights=w, minlength=n_residues)
+            for w in [x, y, x * y, x * x, y * y, np.ones_like(x)]
+        ], axis=-1)
+
+        n_atoms = np.bincount(resindices, minlength=n_residues)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            q_residue = np.where(n_atoms > 0, q_sum / n_atoms, np.nan)
+        return {"cc": _cc_from_moments(moments),
+                "q": q_residue,
+                "moments": moments,
+                }
+
+    @staticmethod
+    def motif_cc(moments: np.ndarray,
+                 motifs: Dict[str, Iterable[int]],
+                 ) -> Dict[str, float]:
+        """ cc per motif {name: resindices} from residue moments
+        """
+        return {name: float(_cc_from_moments(
+                    moments[np.fromiter(resindices, dtype=int)].sum(axis=0)))
+                for name, resindices in motifs.items()
+                }
+
+
+def residue_scores(scores: Dict[str, np.ndarray],
+                   resindices: Iterable[int],
+                   ) -> Dict[int, Dict[str, float]]:
+    return {resindex: {"cc": scores["cc"][resindex],
+                       "q": scores["q"][resindex],
+                       }
+            for resindex in resindices
+            }
+
+
+def motif_selections(categories: Dict[str, set]
+                     ) -> Dict[str, Tuple[int, ...]]:
+    """ {category:type_identifier: resindices} from segmentation.categorise
+    """
+    return {"{}:{}_{}".format(name, typ, key): tuple(sorted(selection))
+            for name, motifs in categories.items()
+            for selection, key, typ in motifs
+            }
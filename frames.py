@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-3#
+import attr
+
+from typing import Iterator, List, Optional, Sequence, Tuple, Any
+
+from project import Project
+
+""" DESCR:
+    FrameSelection Class selects the frames of a trajectory that are
+    analysed. Frames are loaded one at a time while iterating.
+
+    COMMENTS:
+    precedence: explicit indices, last-N, start/stop/step, number of frames
+"""
+
+
+@attr.s(slots=True)
+class FrameSelection(object):
+    """ frames: number of evenly spaced frames ending at the last frame
+        indices: explicit frame indices (negative counts from the end)
+        last: the last N frames
+        start, stop, step: python slice of the trajectory
+    """
+    frames: int = attr.ib(default=1)
+    start: Optional[int] = attr.ib(default=None)
+    stop: Optional[int] = attr.ib(default=None)
+    step: Optional[int] = attr.ib(default=None)
+    indices: Optional[List[int]] = attr.ib(default=None)
+    last: Optional[int] = attr.ib(default=None)
+
+    @classmethod
+    def from_project(cls, project: Project) -> "FrameSelection":
+        return cls(frames=project.frames,
+                   start=project.start,
+                   stop=project.stop,
+                   step=project.step,
+                   indices=project.frame_list,
+                   last=project.last,
+                   )
+
+    def select(self, n_frames: int) -> Sequence[int]:
+        """ selected frame indices as range or list, in trajectory order
+        """
+        all_frames = range(n_frames)
+        if self.indices is not None:
+            return [all_frames[i] for i in self.indices]
+        elif self.last is not None:
+            return all_frames[max(n_frames - self.last, 0):]
+        elif any(x is not None for x in [self.start, self.stop, self.step]):
+            return all_frames[self.start:self.stop:self.step]
+        else:
+            frames_step = max(n_frames // max(self.frames, 1), 1)
+            return all_frames[::-frames_step][:self.frames][::-1]
+
+    def iterate(self, trajectory: Any, skip: int = 0
+                ) -> Iterator[Tuple[int, Any]]:
+        """ lazily yields (i, timestep) for the selected frames, the first
+            skip selected frames are not loaded
+        """
+        frames = self.select(len(trajectory))
+        for i in range(skip, len(frames)):
+            yield i, trajectory[frames[i]]
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-3#
+import numpy as np
+
+""" DESCR:
+    fourier shell correlation of batches of half map pairs. all pairs of a
+    batch share one cubic box and are transformed with one batched FFT.
+
+    COMMENTS:
+    shells are rounded radii of the rfft grid, the half-space of the real
+    transform is used as is (kx = 0 plane not doubled).
+    resolution at the first crossing of FSC_THRESHOLD, linear interpolation
+    between shells. curves that never cross are reported at nyquist, curves
+    that cross before the first shell (no resolved shell) as nan.
+"""
+
+FSC_THRESHOLD: float = 0.143
+
+
+def shell_index(box: int) -> np.ndarray:
+    """ fourier shell of every rfft coefficient of a cubic box (z, y, x)
+    """
+    k = np.fft.fftfreq(box) * box
+    kx = np.fft.rfftfreq(box) * box
+    radius = np.sqrt(k[:, np.newaxis, np.newaxis]**2
+                     + k[np.newaxis, :, np.newaxis]**2
+                     + kx[np.newaxis, np.newaxis, :]**2)
+    return np.rint(radius).astype(int)
+
+
+def fsc_curves(half1: np.ndarray, half2: np.ndarray) -> np.ndarray:
+    """ half1, half2: (n, box, box, box)
+        Returns
+        -------
+            fsc (n, box // 2 + 1) per shell, nan for empty shells
+    """
+    n, box = half1.shape[0], half1.shape[-1]
+    n_shells = box // 2 + 1
+    f1 = np.fft.rfftn(half1, axes=(1, 2, 3)).reshape(n, -1)
+    f2 = np.fft.rfftn(half2, axes=(1, 2, 3)).reshape(n, -1)
+
+    shells = shell_index(box).ravel()
+    keep = shells < n_shells
+    f1, f2 = f1[:, keep], f2[:, keep]
+    idx = (np.arange(n)[:, np.newaxis] * n_shells + shells[keep]).ravel()
+
+    def shell_sum(values: np.ndarray) -> np.ndarray:
+        return np.bincount(idx, weights=values.ravel(),
+                           minlength=n * n_shells).reshape(n, n_shells)
+
+    cross = shell_sum(np.real(f1 * np.conj(f2)))
+    power = shell_sum(np.abs(f1)**2) * shell_sum(np.abs(f2)**2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(power > 0., cross / np.sqrt(power), np.nan)
+
+
+def fsc_resolution(fsc: np.ndarray, box: int, voxel_size: float,
+                   threshold: float = FSC_THRESHOLD) -> np.ndarray:
+    """ resolution [A] at the first shell below threshold per curve (n,)
+    """
+    n_shells = fsc.shape[1]
+    below = np.nan_to_num(fsc[:, 1:], nan=-1.) < threshold
+    crosses = np.any(below, axis=1)
+    shell = np.where(crosses, np.argmax(below, axis=1) + 1, n_shells - 1)
+
+    rows = np.arange(len(fsc))
+    high = fsc[rows, shell - 1]
+    low = np.nan_to_num(fsc[rows, shell], nan=-1.)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        fraction = np.clip((high - threshold) / (high - low), 0., 1.)
+    shell_cross = np.where(crosses, shell - 1 + fraction, n_shells - 1)
+    # crossing between DC and the first shell: no shell is resolved
+    unresolved = np.isnan(fsc[:, 1]) | (crosses & (shell == 1))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        resolution = box * voxel_size / shell_cross
+    return np.where(unresolved, np.nan, resolution)
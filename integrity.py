@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-3#
+import numpy as np
+import MDAnalysis as mda
+import attr
+
+from typing import Dict, Tuple, Any, List
+
+from basepair import BasePair
+from utils import WC_HBONDS, WC_HBONDS_DIST, C1P_BASEDIST
+
+""" DESCR:
+    BasePairIntegrity Class classifies all watson-crick basepairs as intact or
+    broken for a list of deviation thresholds in one pass. Deviations of the
+    C1'-C1' distance and of the H-bond distances are relative to their ideal
+    values. A basepair is broken if any deviation exceeds the threshold.
+
+    COMMENTS:
+    atom indices are collected once on construction, every call of classify()
+    only uses the current positions of the universe. build one instance per
+    run and reuse it for every frame (BDna(integrity=...)).
+"""
+
+N_BONDS: int = 4  # C1'C1' + up to three H-bonds
+
+
+@attr.s
+class BasePairIntegrity(object):
+    u: "mda.universe" = attr.ib()
+    bps: Dict[Tuple[int, int], BasePair] = attr.ib()
+
+    def __attrs_post_init__(self) -> None:
+        self.resindices, self.atoms_sc, self.atoms_st, self.ideal = (
+            self._get_bond_atoms()
+        )
+
+    def _get_bond_atoms(self) -> Tuple["np.ndarray", "np.ndarray",
+                                       "np.ndarray", "np.ndarray"]:
+        """ Returns
+            -------
+                resindices (n_bp, 2) scaffold, staple
+                atom indices scaffold (n_bp, N_BONDS), -1 if not present
+                atom indices staple (n_bp, N_BONDS), -1 if not present
+                ideal distances (n_bp, N_BONDS), nan if not present
+        """
+        resindices, atoms_sc, atoms_st, ideal = [], [], [], []
+        for bp in self.bps.values():
+            if not bp.is_ds:
+                continue
+            names_sc = {a.name: a.ix for a in bp.sc.atoms}
+            names_st = {a.name: a.ix for a in bp.st.atoms}
+            bonds = [("C1'", "C1'", C1P_BASEDIST)]
+            bonds += list(zip(WC_HBONDS[bp.sc.resname],
+                              WC_HBONDS[bp.st.resname],
+                              WC_HBONDS_DIST[bp.sc.resname],
+                              ))
+            bonds += [(None, None, np.nan)] * (N_BONDS - len(bonds))
+
+            resindices.append((bp.sc.resindex, bp.st.resindex))
+            atoms_sc.append([names_sc.get(a, -1) for a, _, _ in bonds])
+            atoms_st.append([names_st.get(b, -1) for _, b, _ in bonds])
+            ideal.append([d for _, _, d in bonds])
+
+        return (np.array(resindices, dtype=int).reshape(-1, 2),
+                np.array(atoms_sc, dtype=int).reshape(-1, N_BONDS),
+                np.array(atoms_st, dtype=int).reshape(-1, N_BONDS),
+                np.array(ideal, dtype=float).reshape(-1, N_BONDS),
+                )
+
+    def deviations(self) -> "np.ndarray":
+        """ relative deviation |d - d0| / d0 (n_bp, N_BONDS), nan if absent
+        """
+        positions = self.u.atoms.positions
+        valid = (self.atoms_sc >= 0) & (self.atoms_st >= 0)
+        dist = np.linalg.norm(positions[self.atoms_sc] -
+                              positions[self.atoms_st],
+                              axis=-1,
+                              )
+        return np.where(valid, np.abs(dist - self.ideal) / self.ideal, np.nan)
+
+    def classify(self, thresholds: List[float]) -> Dict[str, Any]:
+        """ Returns
+            -------
+                thresholds (n_thresholds,)
+                resindices (n_bp, 2)
+                deviations (n_bp, N_BONDS)
+                broken (n_thresholds, n_bp) boolean mask
+                counts (n_thresholds,) number of broken basepairs
+        """
+        thresholds = np.asarray(thresholds, dtype=float)
+        deviations = self.deviations()
+        max_deviation = np.nanmax(
+            np.where(np.isnan(deviations), -np.inf, deviations), axis=1)
+        broken = max_deviation[np.newaxis, :] > thresholds[:, np.newaxis]
+        return {"thresholds": thresholds,
+                "resindices": self.resindices,
+                "deviations": deviations,
+                "broken": broken,
+                "counts": broken.sum(axis=1),
+                }
+
+
+def integrity_counts(bp_integrity: Dict[str, Any]) -> Dict[str, float]:
+    """ number of broken basepairs of the frame per threshold
+    """
+    return {"dev{}".format(threshold): float(count)
+            for threshold, count in zip(bp_integrity["thresholds"],
+                                        bp_integrity["counts"])
+            }
+
+
+def integrity_per_residue(bp_integrity: Dict[str, Any]
+                          ) -> Dict[int, Dict[str, float]]:
+    """ broken state of the basepair of every residue per threshold
+    """
+    per_residue: Dict[int, Dict[str, float]] = dict()
+    thresholds = ["dev{}".format(t) for t in bp_integrity["thresholds"]]
+    broken = bp_integrity["broken"].T.astype(float)
+    for resindices, bp_broken in zip(bp_integrity["resindices"], broken):
+        for resindex in resindices:
+            per_residue[resindex] = dict(zip(thresholds, bp_broken))
+    return per_residue
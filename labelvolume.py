@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-3#
+import mrcfile as mrc
+import numpy as np
+import MDAnalysis as mda
+import attr
+
+from pathlib import Path
+from typing import Iterable, List, Tuple
+
+from utils import UnexpectedCaseError
+from mrcmap import MrcMap
+from segmentation import atom_bounds, cubic_box, csr_rows
+
+""" DESCR:
+    LabelVolume assigns every voxel within context of an atom to the residue
+    of its closest atom. the segments of all motifs are cut from one label
+    volume instead of one atom mask per motif.
+
+    COMMENTS:
+    labels in (z, y, x) order, box low and positions in (x, y, z)
+"""
+
+
+def _context_offsets(context: float,
+                     voxel_size: np.ndarray,
+                     spherical: bool = False,
+                     ) -> np.ndarray:
+    """ voxel offsets (z, y, x) covered by the atom_mask of a single voxel
+    """
+    v_context = np.full(3, context / voxel_size).astype(int) + 1
+    if not spherical:
+        axes = [np.arange(-v, v) for v in v_context]
+        return np.stack(np.meshgrid(*axes, indexing="ij"),
+                        axis=-1).reshape(-1, 3)
+
+    vz, vy, vx = v_context
+    offsets = list()
+    for z in range(-vz, vz + 1):
+        for y in range(-vy, vy + 1):
+            r2 = context**2 - (z * voxel_size[0])**2 - (y * voxel_size[1])**2
+            if r2 < 0:
+                continue
+            w = min(int(np.sqrt(r2) / voxel_size[2]), vx)
+            for x in range(-w, w + 1):
+                offsets.append((z, y, x))
+    return np.array(offsets, dtype=int)
+
+
+@attr.s
+class LabelVolume(object):
+    """ nearest residue of every voxel within context of an atom, -1
+        elsewhere. labels (z, y, x) cover the voxel box starting at low
+        (x, y, z) of mrc_map. the voxels of every residue are indexed once
+        (CSR), masks and segments of any motif are lookups.
+    """
+    mrc_map: MrcMap = attr.ib()
+    labels: np.ndarray = attr.ib()
+    low: np.ndarray = attr.ib()
+    n_residues: int = attr.ib()
+
+    def __attrs_post_init__(self) -> None:
+        labels = self.labels.ravel()
+        labelled = np.flatnonzero(labels >= 0)
+        self.order: np.ndarray = labelled[
+            np.argsort(labels[labelled], kind="stable")]
+        self.counts: np.ndarray = np.bincount(labels[labelled],
+                                              minlength=self.n_residues)
+        self.offsets: np.ndarray = np.concatenate(
+            ([0], np.cumsum(self.counts)[:-1]))
+
+    @classmethod
+    def from_atoms(cls, atoms: "mda.AtomGroup",
+                   mrc_map: MrcMap,
+                   context: int = 3,
+                   spherical: bool = False,
+                   ) -> "LabelVolume":
+        """ labels of the residues of atoms at their current positions.
+            every voxel of the atom_mask of all atoms is assigned to the
+            residue of the closest atom whose context covers the voxel, in
+            one pass over the context offsets.
+        """
+        positions = atoms.positions
+        low, high = atom_bounds(positions, mrc_map, context)
+        shape = (high - low)[::-1]
+        voxel_size = mrc_map.voxel_size[::-1]
+
+        # labels padded by the context, no bounds check per offset
+        offsets = _context_offsets(context, voxel_size, spherical)
+        v_pad = np.abs(offsets).max(axis=0)
+        shape_pad = shape + 2 * v_pad
+        voxels = (mrc_map.voxels(positions) - low)[:, ::-1] + v_pad
+        # position - voxel center [A], (z, y, x)
+        delta = ((positions - mrc_map.origin) / mrc_map.voxel_size
+                 - low)[:, ::-1] * voxel_size - (voxels - v_pad) * voxel_size
+        inside = np.all((voxels >= 0) & (voxels < shape_pad), axis=1)
+        voxels, delta = voxels[inside], delta[inside]
+        resindices = atoms.resindices[inside]
+
+        # atoms sharing a voxel are split into layers, the voxels hit by one
+        # offset of one layer are unique
+        strides = np.array([shape_pad[1] * shape_pad[2], shape_pad[2], 1])
+        flat_atoms = voxels @ strides
+        order = np.argsort(flat_atoms, kind="stable")
+        first = np.searchsorted(flat_atoms[order], flat_atoms[order])
+        rank = np.empty(len(order), dtype=int)
+        rank[order] = np.arange(len(order)) - first
+
+        best = np.full(int(np.prod(shape_pad)), np.inf)
+        labels = np.full(int(np.prod(shape_pad)), -1, dtype=np.int32)
+        offsets_flat = offsets @ strides
+        offsets_A = offsets * voxel_size
+        offsets_d2 = np.sum(offsets_A**2, axis=1)
+        for layer in range(rank.max(initial=-1) + 1):
+            in_layer = rank == layer
+            flat_layer = flat_atoms[in_layer]
+            d = delta[in_layer]
+            d2_layer = np.sum(d**2, axis=1)
+            res_layer = resindices[in_layer]
+            for offset_flat, offset_A, offset_d2 in zip(
+                    offsets_flat, offsets_A, offsets_d2):
+                flat = flat_layer + offset_flat
+                d2 = d2_layer + offset_d2 - 2. * (d @ offset_A)
+                closer = d2 < best[flat]
+                best[flat[closer]] = d2[closer]
+                labels[flat[closer]] = res_layer[closer]
+
+        crop = tuple(slice(v, v + n) for v, n in zip(v_pad, shape))
+        labels = labels.reshape(shape_pad)[crop]
+        return cls(mrc_map=mrc_map,
+                   labels=np.ascontiguousarray(labels),
+                   low=low,
+                   n_residues=len(atoms.universe.residues),
+                   )
+
+    def voxels(self, resindices: Iterable[int]) -> np.ndarray:
+        """ flat indices into labels of all voxels of the residues
+        """
+        return csr_rows(self.order, self.offsets, self.counts, resindices)
+
+    def cut(self, resindices: Iterable[int], mrc_maps: List[MrcMap]
+            ) -> Tuple[List[np.ndarray], np.ndarray]:
+        """ map values of the voxels of the residues in a cubic box for each
+            of the aligned mrc_maps. box and returned origin follow the box
+            arithmetic of cut_segments (cubic_box), the voxels are those
+            labelled with the residues instead of the full atom_mask.
+        """
+        idx = np.array(np.unravel_index(self.voxels(resindices),
+                                        self.labels.shape))
+        if not idx.shape[1]:
+            raise UnexpectedCaseError("no voxels in this selection")
+        pos_min, pos_max, pos_low, _, s_cell = cubic_box(idx)
+        # data box [pos_min, pos_max) as in cut_segments
+        idx = idx[:, np.all(idx < pos_max[:, np.newaxis], axis=0)]
+        local = tuple(idx - pos_min[:, np.newaxis] + pos_low[:, np.newaxis])
+
+        low = self.low + pos_min[::-1]
+        high = self.low + pos_max[::-1]
+        segments = list()
+        for mrc_map in mrc_maps:
+            if not self.mrc_map.same_grid(mrc_map):
+                raise UnexpectedCaseError(
+                    "{} and {} are not on the same grid".format(
+                        self.mrc_map.path, mrc_map.path))
+            data = mrc_map.subvolume(low=low, high=high)
+            data_small = np.zeros(np.full(3, s_cell), dtype=np.float32)
+            data_small[local] = data[tuple(idx - pos_min[:, np.newaxis])]
+            segments.append(data_small)
+        return segments, low - pos_low[::-1]
+
+    def write(self, path: Path) -> None:
+        """ labels as float32 map on the grid of mrc_map
+        """
+        voxel_size = self.mrc_map.voxel_size
+        with mrc.new(path, overwrite=True) as mrc_out:
+            mrc_out.set_data(self.labels.astype(np.float32))
+            mrc_out._set_voxel_size(*(voxel_size))
+            mrc_out.header["origin"] = tuple(self.mrc_map.origin
+                                             + self.low * voxel_size)
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-3#
 import pickle
+import hashlib
 import attr
 
 from typing import Dict, Tuple, List, Set
@@ -30,6 +31,8 @@ class Linkage(object):
     FidSeq_global: Dict[int, str] = dict()
     FidHN: Dict[int, List[int]] = {}
     Fco: Dict[str, Crossover] = {}
+    # domain id -> (fit ids, number of design bases, connected id, is_scaf)
+    Fdomains: Dict[int, Tuple[List[int], int, int, bool]] = {}
     Dhp_skips: Set[Tuple[int, int]] = set()
     u: "mda.universe" = None
 
@@ -76,6 +79,17 @@ class Linkage(object):
                 value = unpickle_Fco(value, self.u)
             setattr(self, name, value)
 
+    def hash(self) -> str:
+        """ identifies the linkage of a design, independent of the fit
+        """
+        content = [
+            sorted((int(k), int(v)) for k, v in self.Fbp.items()),
+            sorted((int(k), int(v)) for k, v in self.DidFid.items()),
+            sorted((int(k), int(v)) for k, v in self.Fnicks.items()),
+            sorted(self.Fco.keys()),
+        ]
+        return hashlib.sha1(repr(content).encode()).hexdigest()
+
     def _reverse(self) -> None:
         def reverse_d(dict: dict) -> dict:
             return {v: k for k, v in iter(dict.items())}
@@ -1,20 +1,25 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-3#
 import attr
-import nanodesign as nd
 
-from nanodesign.data.base import DnaBase
-from typing import Dict, Tuple, Optional, List, Set
+from typing import Dict, Tuple, Optional, List, Set, TYPE_CHECKING
 
 from project import Project
 from fit import Fit
-from design import Design
 from crossover import Crossover
 from linkage import Linkage
 from basepair import BasePair
 
+if TYPE_CHECKING:
+    import nanodesign as nd
+    from nanodesign.data.base import DnaBase
+
 """ DESCR:
     create Linkage. first loads pickled linkage if available.
+
+    COMMENTS:
+    nanodesign is imported with Design when a Linker reads the cadnano
+    design, subclasses that provide their own design run without it.
 """
 
 
@@ -24,15 +29,19 @@ class Linker(object):
     """
     # TODO: move categorize to linker?
     project: Project = attr.ib()
-    Fbp: Dict[int, int] = dict()
-    DidFid: Dict[int, int] = dict()
-    DhpsDid: Dict[Tuple[int, int, bool], int] = dict()
-    Fnicks: Dict[int, int] = dict()
-    FidSeq_local: Dict[int, str] = dict()
-    FidSeq_global: Dict[int, str] = dict()
-    Fco: Dict[str, Crossover] = dict()
+    Fbp: Dict[int, int] = attr.ib(factory=dict, init=False)
+    DidFid: Dict[int, int] = attr.ib(factory=dict, init=False)
+    DhpsDid: Dict[Tuple[int, int, bool], int] = attr.ib(factory=dict,
+                                                        init=False)
+    Fnicks: Dict[int, int] = attr.ib(factory=dict, init=False)
+    FidSeq_local: Dict[int, str] = attr.ib(factory=dict, init=False)
+    FidSeq_global: Dict[int, str] = attr.ib(factory=dict, init=False)
+    Fco: Dict[str, Crossover] = attr.ib(factory=dict, init=False)
+    Fdomains: Dict[int, Tuple[List[int], int, int, bool]] = attr.ib(
+        factory=dict, init=False)
 
     def __attrs_post_init__(self) -> None:
+        from design import Design
         self.fit: Fit = Fit(self.project)
         self.design: Design = Design(self.project)
         self.Dhp_skips: Set[Tuple[int, int]] = self.design.Dhp_skips
@@ -137,12 +146,14 @@ class Linker(object):
         self._identify_nicks()
         self._eval_sequence()
         self._eval_FidHelixneighbors()
+        self._identify_domains()
         self.link = Linkage(
             Fbp=self.Fbp,
             DidFid=self.DidFid,
             DhpsDid=self.DhpsDid,
             Dcolor=self.Dcolor,
             Fco=self.Fco,
+            Fdomains=self.Fdomains,
             Fnicks=self.Fnicks,
             FidSeq_local=self.FidSeq_local,
             FidSeq_global=self.FidSeq_global,
@@ -244,8 +255,8 @@ class Linker(object):
         }
         return self.Fbp
 
-    def _get_n_strand(self, base: DnaBase, direct: str, steps=1, local=True
-                      ) -> Optional[DnaBase]:
+    def _get_n_strand(self, base: "DnaBase", direct: str, steps=1,
+                      local=True) -> Optional["DnaBase"]:
         """direct = ["up","down"]"""
         if steps == 0:
             return base
@@ -260,8 +271,8 @@ class Linker(object):
                 return None
         return base
 
-    def _get_n_helix(self, base: DnaBase, direct: int, steps=1
-                     ) -> Optional[DnaBase]:
+    def _get_n_helix(self, base: "DnaBase", direct: int, steps=1
+                     ) -> Optional["DnaBase"]:
         """direct = [1,-1]"""
         if steps == 0:
             return base
@@ -296,7 +307,7 @@ class Linker(object):
             hp = (base.h, base.p)
             return BasePair(sc=sc, st=st, hp=hp)
 
-    def is_co(self, base: DnaBase, neighbor: Optional[DnaBase]
+    def is_co(self, base: "DnaBase", neighbor: Optional["DnaBase"]
               ) -> bool:
         if neighbor is None:
             return False
@@ -308,17 +319,17 @@ class Linker(object):
             -------
                 self.Fco
         """
-        def get_co_leg(base: Optional[DnaBase], direct: int
-                       ) -> Optional[DnaBase]:
+        def get_co_leg(base: Optional["DnaBase"], direct: int
+                       ) -> Optional["DnaBase"]:
             if base is None:
                 return None
             else:
                 return self._get_n_helix(base=base, direct=direct, steps=2)
 
-        def get_co(bA: DnaBase,
-                   bC: DnaBase,
-                   bB: Optional[DnaBase],
-                   bD: Optional[DnaBase],
+        def get_co(bA: "DnaBase",
+                   bC: "DnaBase",
+                   bB: Optional["DnaBase"],
+                   bD: Optional["DnaBase"],
                    direct: int,
                    typ: str,
                    ) -> Tuple[str, Crossover]:
@@ -378,7 +389,7 @@ class Linker(object):
             -------
                 self.Fnicks
         """
-        def is_nick(candidate: DnaBase, base: DnaBase) -> bool:
+        def is_nick(candidate: "DnaBase", base: "DnaBase") -> bool:
             is_onhelix = (candidate.h == base.h)
             is_neighbor = (abs(base.p - candidate.p) <= 2)  # skip = 2
             is_base = (candidate is base)
@@ -400,6 +411,22 @@ class Linker(object):
             if is_nick(candidate=candi, base=start)
         }
 
+    def _identify_domains(self) -> None:
+        """ Affects
+            -------
+                self.Fdomains
+        """
+        for domain in self.design.design.domain_list:
+            bases = domain.base_list
+            Fids = [self.DidFid[base.id] for base in bases
+                    if base.id in self.DidFid  # !skip
+                    ]
+            self.Fdomains[domain.id] = (Fids,
+                                        len(bases),
+                                        domain.connected_domain,
+                                        bases[0].is_scaf,
+                                        )
+
 
 def get_linkage(project: Project) -> Linkage:
     if project.relink:
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-3#
+import itertools
+import mrcfile as mrc
+import numpy as np
+import MDAnalysis as mda
+import attr
+
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from mrcmap import MrcMap
+
+""" DESCR:
+    ModelMap Class simulates the density of an atomic model on the grid of an
+    experimental map. Atoms are splatted trilinearly with their element
+    weight onto a cropped subvolume, which is then blurred with a separable
+    gaussian kernel.
+
+    COMMENTS:
+    sigma = 0.225 * resolution, kernels are truncated at KERNEL_WIDTH sigma.
+    the element is taken from the first letter of the atom name.
+    subvolumes and kernels are in (z, y, x) order, low voxel in (x, y, z).
+"""
+
+SIGMA_FACTOR: float = 0.225
+KERNEL_WIDTH: float = 3.
+# approximate scattering weight: atomic number
+ELEMENT_WEIGHTS: dict = {"H": 1., "C": 6., "N": 7., "O": 8., "P": 15.,
+                         "S": 16.,
+                         }
+
+
+def atom_weights(atoms: "mda.AtomGroup") -> np.ndarray:
+    return np.array([ELEMENT_WEIGHTS.get(name[0], ELEMENT_WEIGHTS["C"])
+                     for name in atoms.names
+                     ])
+
+
+def _gaussian_kernel(sigma: float) -> np.ndarray:
+    """ normalised 1D kernel, sigma in voxel
+    """
+    radius = int(np.ceil(KERNEL_WIDTH * sigma))
+    x = np.arange(-radius, radius + 1)
+    kernel = np.exp(-0.5 * (x / sigma)**2)
+    return kernel / kernel.sum()
+
+
+def _convolve1d(data: np.ndarray, kernel: np.ndarray, axis: int
+                ) -> np.ndarray:
+    """ convolution along axis with zero boundary, same shape as data
+    """
+    radius = len(kernel) // 2
+    pad = [(0, 0)] * data.ndim
+    pad[axis] = (radius, radius)
+    padded = np.pad(data, pad)
+    out = np.zeros_like(data)
+    n = data.shape[axis]
+    for shift, weight in enumerate(kernel):
+        window = [slice(None)] * data.ndim
+        window[axis] = slice(shift, shift + n)
+        out += weight * padded[tuple(window)]
+    return out
+
+
+@attr.s
+class ModelMap(object):
+    mrc_map: MrcMap = attr.ib()
+    resolution: float = attr.ib(default=6.)
+
+    def __attrs_post_init__(self) -> None:
+        self.sigma: float = SIGMA_FACTOR * self.resolution
+        sigma_voxel = self.sigma / self.mrc_map.voxel_size
+        # kernels in (z, y, x) order
+        self.kernels: List[np.ndarray] = [_gaussian_kernel(s)
+                                          for s in sigma_voxel[::-1]
+                                          ]
+        self.v_pad: np.ndarray = np.array([len(k) // 2 + 1
+                                           for k in self.kernels[::-1]
+                                           ])
+
+    def bounds(self, positions: np.ndarray
+               ) -> Tuple[np.ndarray, np.ndarray]:
+        """ voxel box [low, high) (x, y, z) of positions + kernel width
+        """
+        voxels = self.mrc_map.voxels(positions)
+        return self.mrc_map.bounds(low=voxels.min(axis=0) - self.v_pad,
+                                   high=voxels.max(axis=0) + self.v_pad + 1,
+                                   )
+
+    def splat(self, positions: np.ndarray, weights: np.ndarray,
+              low: np.ndarray, high: np.ndarray) -> np.ndarray:
+        """ trilinear distribution of weights onto voxel box [low, high)
+        """
+        shape = (high - low)[::-1]
+        v = (positions - self.mrc_map.origin) / self.mrc_map.voxel_size - low
+        v0 = np.floor(v).astype(int)
+        fraction = v - v0
+
+        data = np.zeros(np.prod(shape))
+        for corner in itertools.product([0, 1], repeat=3):
+            corner = np.array(corner)
+            idx = (v0 + corner)[:, ::-1]
+            w = weights * np.prod(np.where(corner, fraction, 1. - fraction),
+                                  axis=1)
+            inside = np.all((idx >= 0) & (idx < shape), axis=1)
+            flat = np.ravel_multi_index(tuple(idx[inside].T), shape)
+            data += np.bincount(flat, weights=w[inside],
+                                minlength=data.size)
+        return data.reshape(shape)
+
+    def simulate(self, atoms: "mda.AtomGroup",
+                 low: Optional[np.ndarray] = None,
+                 high: Optional[np.ndarray] = None,
+                 ) -> Tuple[np.ndarray, np.ndarray]:
+        """ model density of atoms at their current positions on voxel box
+            [low, high). default box: atoms + kernel width.
+            Returns
+            -------
+                density (z, y, x), low voxel (x, y, z)
+        """
+        positions = atoms.positions
+        if low is None or high is None:
+            low, high = self.bounds(positions)
+        data = self.splat(positions, atom_weights(atoms), low, high)
+        for axis, kernel in enumerate(self.kernels):
+            data = _convolve1d(data, kernel, axis=axis)
+        return data.astype(np.float32), low
+
+    def write(self, path: Path, data: np.ndarray, low: np.ndarray) -> None:
+        """ write subvolume with voxel box low on the grid of the map
+        """
+        voxel_size = self.mrc_map.voxel_size
+        with mrc.new(path, overwrite=True) as mrc_out:
+            mrc_out.set_data(data)
+            mrc_out._set_voxel_size(*(voxel_size))
+            mrc_out.header["origin"] = tuple(self.mrc_map.origin
+                                             + low * voxel_size)
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-3#
+import mrcfile as mrc
+import numpy as np
+import attr
+import shutil
+import tempfile
+
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+from utils import UnexpectedCaseError
+
+""" DESCR:
+    MrcMap Class gives memory-mapped access to a cryo-EM map. The data stays
+    in the native (z, y, x) order of the file, only the voxels that are
+    indexed are read from disk. Header information (origin, voxel_size,
+    shape) and atom positions are given in (x, y, z).
+
+    MapCache opens every map once and shares it between all users. for a
+    process pool, MapCache.shared writes every binned map once to a temporary
+    file that the workers memory-map via aliases instead of binning again.
+
+    binning > 1 replaces the data by the mean of cubic blocks of binning**3
+    voxels, read slab by slab on first access to the data. the binned map is
+    held in memory, share one MapCache to bin every map once.
+
+    COMMENTS:
+    voxel i is centered at origin + i * voxel_size
+    binned: voxel_size * binning, origin + (binning - 1) / 2 * voxel_size,
+        voxels beyond the last full block are dropped
+"""
+
+
+@attr.s
+class MrcMap(object):
+    path: Path = attr.ib()
+    binning: int = attr.ib(default=1)
+
+    def __attrs_post_init__(self) -> None:
+        self.mrc = mrc.mmap(str(self.path), mode="r")
+        header = self.mrc.header
+        o = np.array(header["origin"])
+        self.origin: np.ndarray = np.array([o["x"], o["y"], o["z"]])
+        c = np.array(header["cella"])
+        cellA = np.array([c["x"], c["y"], c["z"]])
+        self.shape: np.ndarray = np.array([header["nx"],
+                                           header["ny"],
+                                           header["nz"],
+                                           ])
+        self.voxel_size: np.ndarray = cellA / self.shape
+        self._data: Optional[np.ndarray] = None
+        if self.binning > 1:
+            self._bin_geometry()
+
+    def _bin_geometry(self) -> None:
+        f = self.binning
+        shape = self.shape // f
+        if np.any(shape == 0):
+            raise UnexpectedCaseError(
+                "binning {} exceeds map {}".format(f, self.path))
+        self.origin = self.origin + 0.5 * (f - 1) * self.voxel_size
+        self.voxel_size = self.voxel_size * f
+        self.shape = shape
+
+    def _bin(self) -> np.ndarray:
+        f = self.binning
+        nx, ny, nz = self.shape
+        data = np.empty((nz, ny, nx), dtype=np.float32)
+        for z in range(nz):
+            slab = self.mrc.data[z * f:(z + 1) * f, :ny * f, :nx * f]
+            data[z] = slab.reshape(f, ny, f, nx, f).mean(axis=(0, 2, 4))
+        return data
+
+    @property
+    def data(self) -> np.ndarray:
+        """ map values (z, y, x). a binned map is computed on first access,
+            geometry (origin, voxel_size, shape) does not need it.
+        """
+        if self._data is None:
+            self._data = self._bin() if self.binning > 1 else self.mrc.data
+        return self._data
+
+    def __enter__(self) -> "MrcMap":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.mrc.close()
+
+    def write(self, path: Path) -> None:
+        """ write data and geometry of the (binned) map to path
+        """
+        with mrc.new(str(path), overwrite=True) as mrc_out:
+            mrc_out.set_data(np.asarray(self.data, dtype=np.float32))
+            mrc_out._set_voxel_size(*(self.voxel_size))
+            mrc_out.header["origin"] = tuple(self.origin)
+
+    def same_grid(self, other: "MrcMap") -> bool:
+        """ voxels of both maps are at the same positions
+        """
+        return (np.array_equal(self.shape, other.shape)
+                and np.allclose(self.origin, other.origin)
+                and np.allclose(self.voxel_size, other.voxel_size)
+                )
+
+    def voxels(self, positions: np.ndarray) -> np.ndarray:
+        """ voxel (x, y, z) closest to each position
+        """
+        return np.rint((positions - self.origin) / self.voxel_size
+                       ).astype(int)
+
+    def values(self, positions: np.ndarray) -> np.ndarray:
+        """ map value at the voxel of each position. reads only the touched
+            voxels of the memory-mapped data.
+        """
+        v = self.voxels(positions)
+        return np.asarray(self.data[v[:, 2], v[:, 1], v[:, 0]])
+
+    def bounds(self, low: np.ndarray, high: np.ndarray
+               ) -> Tuple[np.ndarray, np.ndarray]:
+        """ clip voxel box [low, high) (x, y, z) to the map
+        """
+        low = np.clip(low, 0, self.shape)
+        high = np.clip(high, low, self.shape)
+        return low, high
+
+    def subvolume(self, low: np.ndarray, high: np.ndarray) -> np.ndarray:
+        """ copy of voxel box [low, high) (x, y, z) in (z, y, x) order
+        """
+        low, high = self.bounds(low, high)
+        return np.array(self.data[low[2]:high[2],
+                                  low[1]:high[1],
+                                  low[0]:high[0],
+                                  ])
+
+
+@attr.s
+class MapCache(object):
+    """ memory-mapped maps by path. each map is opened on first access and
+        stays open until the cache is closed. all maps are binned by binning.
+        aliases: {path: path of the file opened instead}
+    """
+    binning: int = attr.ib(default=1)
+    aliases: Dict[Path, Path] = attr.ib(factory=dict)
+
+    def __attrs_post_init__(self) -> None:
+        self.maps: Dict[Path, MrcMap] = dict()
+        self.tmp: Optional[Path] = None
+        self.binned: Dict[Path, Path] = dict()
+
+    def __getitem__(self, path: Union[str, Path]) -> MrcMap:
+        path = Path(path).resolve()
+        if path not in self.maps:
+            self.maps[path] = MrcMap(self.aliases.get(path, path),
+                                     binning=self.binning)
+        return self.maps[path]
+
+    def shared(self, paths: Iterable[Union[str, Path]]) -> Dict[Path, Path]:
+        """ aliases for a MapCache of another process. binned maps are
+            written once to a temporary directory that is removed on close.
+            Returns
+            -------
+                {path: path of the binned map}, empty without binning
+        """
+        if self.binning == 1:
+            return dict()
+        if self.tmp is None:
+            self.tmp = Path(tempfile.mkdtemp(prefix="mapcache-"))
+        for path in {Path(p).resolve() for p in paths} - set(self.binned):
+            path_binned = self.tmp / "{}_{}.mrc".format(len(self.binned),
+                                                         path.stem)
+            self[path].write(path_binned)
+            self.binned[path] = path_binned
+        return dict(self.binned)
+
+    def __enter__(self) -> "MapCache":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        for mrc_map in self.maps.values():
+            mrc_map.close()
+        self.maps = dict()
+        if self.tmp is not None:
+            shutil.rmtree(self.tmp, ignore_errors=True)
+            self.tmp = None
+            self.binned = dict()
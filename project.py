@@ -3,6 +3,7 @@
 
 import attr
 from pathlib import Path
+from typing import List, Optional
 
 """ DESCR:
     Context Class to store user input and pass it between various scripts.
@@ -16,10 +17,24 @@ class Project(object):
     name: str = attr.ib()
     # specific FitAnalysis
     frames: int = attr.ib(default=1)
-    dev: float = attr.ib(default=0.)
+    start: Optional[int] = attr.ib(default=None)
+    stop: Optional[int] = attr.ib(default=None)
+    step: Optional[int] = attr.ib(default=None)
+    frame_list: Optional[List[int]] = attr.ib(default=None)
+    last: Optional[int] = attr.ib(default=None)
+    dev: List[float] = attr.ib(default=attr.Factory(lambda: [0.1]))
     relink: bool = attr.ib(default=False)
     localres: bool = attr.ib(default=False)
+    score: bool = attr.ib(default=False)
     pdb: bool = attr.ib(default=False)
+    precision: str = attr.ib(default="float32")
+    export: Optional[str] = attr.ib(default=None)
+    export_frame: int = attr.ib(default=-1)
+    accumulate: bool = attr.ib(default=False)
+    bins: int = attr.ib(default=0)
+    metrics: Optional[List[str]] = attr.ib(default=None)
+    resume: bool = attr.ib(default=False)
+    checkpoint: int = attr.ib(default=10)
     # specific FitLinker
     ENmodify: bool = attr.ib(default=False)
     EN: str = attr.ib(default="11111110")
@@ -27,4 +42,15 @@ class Project(object):
     context: int = attr.ib(default=5)
     range: int = attr.ib(default=10)
     halfmap: bool = attr.ib(default=False)
+    fsc: bool = attr.ib(default=False)
     star: bool = attr.ib(default=False)
+    spherical: bool = attr.ib(default=False)
+    workers: int = attr.ib(default=1)
+    stack: bool = attr.ib(default=False)
+    labels: bool = attr.ib(default=False)
+    modelmap: bool = attr.ib(default=False)
+    resolution: float = attr.ib(default=6.)
+    binning: int = attr.ib(default=1)
+    compress: bool = attr.ib(default=False)
+    yes: bool = attr.ib(default=False)
+    plan: bool = attr.ib(default=False)
@@ -4,14 +4,15 @@
 import mrcfile as mrc
 import numpy as np
 import MDAnalysis as mda
+import attr
 
-from typing import Dict, Set, Tuple, FrozenSet
+from typing import Dict, Set, Tuple, FrozenSet, List, Iterable
 from pathlib import Path
 
 from utils import UnexpectedCaseError
 from linkage import Linkage
 from project import Project
-from design import Design
+from mrcmap import MrcMap
 
 """ DESCR:
     collection of scripts to allow creating subsets of a cryo-EM map.
@@ -23,25 +24,173 @@ from design import Design
 
 STAR_HEADER = """data_\n\nloop_\n_rlnMicrographName #1\n_rlnCoordinateX #2
 _rlnCoordinateY #3\n_rlnCoordinateZ #4\n"""
+MRC_HEADER_BYTES: int = 1024
 
 
-def mrc_segment(atoms: "mda.atomgroup",
-                path_in: Path,
-                path_out: Path,
-                context: int = 3,
-                star: bool = False,
-                ) -> None:
+@attr.s(slots=True, frozen=True)
+class SegmentFormat(object):
+    """ file format of written segments: float32 (mrc mode 2) or float16
+        (mode 12) data, optionally gzip compressed (.mrc.gz)
+    """
+    precision: str = attr.ib(default="float32")
+    compress: bool = attr.ib(default=False)
+
+    @property
+    def dtype(self) -> np.dtype:
+        return np.dtype(self.precision)
+
+    @property
+    def mrc_mode(self) -> int:
+        return 12 if self.dtype == np.float16 else 2
+
+    def path(self, path: Path) -> Path:
+        return path.with_name(path.name + ".gz") if self.compress else path
+
+    def nbytes(self, shape: Tuple[int, ...]) -> int:
+        """ uncompressed file size of a map of shape
+        """
+        return MRC_HEADER_BYTES + int(np.prod(shape)) * self.dtype.itemsize
+
+    def new(self, path: Path) -> "mrc.mrcfile.MrcFile":
+        return mrc.new(self.path(path), overwrite=True,
+                       compression="gzip" if self.compress else None)
+
+
+def csr_rows(order: np.ndarray,
+             offsets: np.ndarray,
+             counts: np.ndarray,
+             resindices: Iterable[int],
+             ) -> np.ndarray:
+    """ entries of the rows resindices of a CSR table: row r holds
+        order[offsets[r]: offsets[r] + counts[r]]. rows in order of resindex
+    """
+    resindices = np.unique(np.fromiter(resindices, dtype=int))
+    counts = counts[resindices]
+    starts = np.repeat(offsets[resindices] - np.cumsum(counts) + counts,
+                       counts)
+    return order[starts + np.arange(counts.sum())]
+
+
+@attr.s
+class ResidueAtoms(object):
+    """ residue -> atom table (CSR) of a universe. atoms of any residue
+        selection are sliced from u.atoms in one operation.
+    """
+    u: "mda.universe" = attr.ib()
+
+    def __attrs_post_init__(self) -> None:
+        resindices = self.u.atoms.resindices
+        self.order: np.ndarray = np.argsort(resindices, kind="stable")
+        self.counts: np.ndarray = np.bincount(
+            resindices, minlength=len(self.u.residues))
+        self.offsets: np.ndarray = np.concatenate(
+            ([0], np.cumsum(self.counts)[:-1]))
+
+    def indices(self, resindices: Iterable[int]) -> np.ndarray:
+        """ atom indices of the residues, in order of resindex
+        """
+        return csr_rows(self.order, self.offsets, self.counts, resindices)
+
+    def atoms(self, resindices: Iterable[int]) -> "mda.AtomGroup":
+        return self.u.atoms[self.indices(resindices)]
+
+
+def _shift_or(dilated: np.ndarray, mask: np.ndarray, offset: np.ndarray
+              ) -> None:
+    """ dilated |= mask shifted by offset. voxels shifted out of the array
+        are dropped.
+    """
+    dst = tuple(slice(max(o, 0), s + min(o, 0))
+                for o, s in zip(offset, mask.shape))
+    src = tuple(slice(max(-o, 0), s - max(o, 0))
+                for o, s in zip(offset, mask.shape))
+    dilated[dst] |= mask[src]
+
+
+def atom_mask(voxels: np.ndarray,
+              shape: Tuple[int, int, int],
+              context: float,
+              voxel_size: np.ndarray,
+              spherical: bool = False,
+              ) -> np.ndarray:
+    """ boolean mask of all voxels within context [A] of an atom voxel.
+        voxels, shape and voxel_size in (z, y, x) order.
+        cube: [v - v_context, v + v_context) per axis around atom voxel v
+        spherical: ball of radius context around atom voxel v
+    """
+    v_context = np.full(3, context / voxel_size).astype(int) + 1
+    shape_pad = np.array(shape) + 2 * v_context
+    voxels_pad = voxels + v_context
+    inside = np.all((voxels_pad >= 0) & (voxels_pad < shape_pad), axis=1)
+
+    mask = np.zeros(shape_pad, dtype=bool)
+    mask[tuple(voxels_pad[inside].T)] = True
+
+    if spherical:
+        # ball = union of x-runs: dilate along x once per run half-width,
+        # then shift the x-dilated masks in the (z, y) plane
+        vz, vy, vx = v_context
+        dz, dy = np.meshgrid(np.arange(-vz, vz + 1), np.arange(-vy, vy + 1),
+                             indexing="ij")
+        r2 = context**2 - (dz * voxel_size[0])**2 - (dy * voxel_size[1])**2
+        half_width = np.full(r2.shape, -1)
+        half_width[r2 >= 0] = np.minimum(
+            np.sqrt(r2[r2 >= 0]) / voxel_size[2], vx).astype(int)
+
+        runs = {0: mask}
+        for w in range(1, half_width.max() + 1):
+            run = runs[w - 1].copy()
+            _shift_or(run, mask, (0, 0, w))
+            _shift_or(run, mask, (0, 0, -w))
+            runs[w] = run
+        dilated = np.zeros_like(mask)
+        for z, y, w in zip(dz.ravel(), dy.ravel(), half_width.ravel()):
+            if w >= 0:
+                _shift_or(dilated, runs[w], (z, y, 0))
+        mask = dilated
+    else:
+        for axis, v in enumerate(v_context):
+            dilated = np.zeros_like(mask)
+            for shift in range(-v, v):
+                offset = np.zeros(3, dtype=int)
+                offset[axis] = shift
+                _shift_or(dilated, mask, offset)
+            mask = dilated
 
-    def remove_padding(data: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
-        idx_data = np.nonzero(data)
+    crop = tuple(slice(v, v + s) for v, s in zip(v_context, shape))
+    return mask[crop]
 
-        pos_min = np.min(idx_data, axis=1)
-        pos_max = np.max(idx_data, axis=1)
-        s_cell = np.max(pos_max - pos_min)
-        pad = 0.5 * (s_cell + pos_min - pos_max)
-        pos_low = [int(p) if (p % 1.) == 0. else int(p) + 1 for p in pad]
-        pos_high = -pad.astype(int)
 
+def cubic_box(idx_data: Tuple[np.ndarray, ...]) -> Tuple[np.ndarray, ...]:
+    """ cubic box around voxel indices (z, y, x). the data box [pos_min,
+        pos_max) is placed at pos_low of a box of edge s_cell.
+    """
+    pos_min = np.min(idx_data, axis=1)
+    pos_max = np.max(idx_data, axis=1)
+    s_cell = np.max(pos_max - pos_min)
+    pad = 0.5 * (s_cell + pos_min - pos_max)
+    pos_low = np.array([int(p) if (p % 1.) == 0. else int(p) + 1
+                        for p in pad])
+    pos_high = -pad.astype(int)
+    return pos_min, pos_max, pos_low, pos_high, s_cell
+
+
+def cut_segments(positions: np.ndarray,
+                 mrc_maps: List[MrcMap],
+                 context: int = 3,
+                 spherical: bool = False,
+                 ) -> Tuple[List[np.ndarray], np.ndarray]:
+    """ map values within context of positions (x, y, z) in a cubic box for
+        each of the aligned mrc_maps. mask and box are computed once and
+        shared by all maps.
+        Returns
+        -------
+            cubic segments in (z, y, x) order, one per map
+            voxel (x, y, z) of the first box voxel in the maps
+    """
+    def remove_padding(data: np.ndarray, box: Tuple[np.ndarray, ...]
+                       ) -> np.ndarray:
+        pos_min, pos_max, pos_low, pos_high, s_cell = box
         data_small = np.zeros(np.full(3, s_cell), dtype=np.float32)
         data_small[pos_low[0]: pos_high[0] or None,
                    pos_low[1]: pos_high[1] or None,
@@ -50,76 +199,164 @@ def mrc_segment(atoms: "mda.atomgroup",
                             pos_min[1]: pos_max[1],
                             pos_min[2]: pos_max[2]
                             ]
-        v_origin_small = pos_min - pos_low
-        return data_small, v_origin_small
+        return data_small
+
+    mrc_map = mrc_maps[0]
+    for other in mrc_maps[1:]:
+        if not mrc_map.same_grid(other):
+            raise UnexpectedCaseError(
+                "{} and {} are not on the same grid".format(mrc_map.path,
+                                                            other.path))
+
+    # only the bounding box of atoms + context is read, (z, y, x) order
+    low, high = atom_bounds(positions, mrc_map, context)
+    data_mask = atom_mask(voxels=(mrc_map.voxels(positions) - low)[:, ::-1],
+                          shape=tuple((high - low)[::-1]),
+                          context=context,
+                          voxel_size=mrc_map.voxel_size[::-1],
+                          spherical=spherical,
+                          )
+    box = cubic_box(np.nonzero(data_mask))
+    v_origin_small = (box[0] - box[2])[::-1] + low
+
+    segments = [remove_padding(data=m.subvolume(low=low, high=high)
+                               * data_mask,
+                               box=box,
+                               )
+                for m in mrc_maps
+                ]
+    return segments, v_origin_small
+
+
+def atom_bounds(positions: np.ndarray, mrc_map: MrcMap, context: int
+                ) -> Tuple[np.ndarray, np.ndarray]:
+    """ voxel box [low, high) (x, y, z) of positions + context in the map
+    """
+    atoms_voxel = mrc_map.voxels(positions)
+    v_context = np.full(3, context / mrc_map.voxel_size).astype(int) + 1
+    return mrc_map.bounds(low=atoms_voxel.min(axis=0) - v_context,
+                          high=atoms_voxel.max(axis=0) + v_context,
+                          )
+
+
+def write_segments(segments: List[np.ndarray],
+                   v_origin_small: np.ndarray,
+                   mrc_map: MrcMap,
+                   paths_out: List[Path],
+                   star: bool = False,
+                   output: SegmentFormat = SegmentFormat(),
+                   ) -> None:
+    """ write cubic segments with first box voxel v_origin_small (x, y, z)
+        on the grid of mrc_map to paths_out
+    """
+    voxel_size = mrc_map.voxel_size
+    origin_small = mrc_map.origin + (v_origin_small * voxel_size)
+    center_small = np.divide(segments[0].shape, 2).astype(int)
+
+    for data_small, path_out in zip(segments, paths_out):
+        with output.new(path_out) as mrc_out:
+            mrc_out.set_data(data_small.astype(output.dtype))
+            mrc_out._set_voxel_size(*(voxel_size))
+            mrc_out.header["origin"] = tuple(origin_small)
+
+        if star:
+            path_star = "Tomograms/seg-co/" + path_out.stem + ".star"
+            path_out_star = path_out.parent / (path_out.stem + ".star")
+            with open(path_out_star, mode="w") as star_out:
+                star_out.write(STAR_HEADER)
+                star_out.write("{} {} {} {}".format(path_star,
+                                                    *center_small))
+
 
+def segment_positions(positions: np.ndarray,
+                      mrc_maps: List[MrcMap],
+                      paths_out: List[Path],
+                      context: int = 3,
+                      star: bool = False,
+                      spherical: bool = False,
+                      output: SegmentFormat = SegmentFormat(),
+                      ) -> None:
+    """ write map values within context of positions (x, y, z) to a cubic
+        map at paths_out for each of the aligned mrc_maps.
+    """
+    segments, v_origin_small = cut_segments(positions=positions,
+                                            mrc_maps=mrc_maps,
+                                            context=context,
+                                            spherical=spherical,
+                                            )
+    write_segments(segments=segments,
+                   v_origin_small=v_origin_small,
+                   mrc_map=mrc_maps[0],
+                   paths_out=paths_out,
+                   star=star,
+                   output=output,
+                   )
+    return
+
+
+def mrc_segment(atoms: "mda.atomgroup",
+                mrc_map: MrcMap,
+                path_out: Path,
+                context: int = 3,
+                star: bool = False,
+                spherical: bool = False,
+                output: SegmentFormat = SegmentFormat(),
+                ) -> None:
     if not len(atoms):
         raise UnexpectedCaseError("no atoms in this selection")
 
     u = atoms.universe
     u.trajectory[-1]
-
-    with mrc.open(path_in, mode='r') as mrc_in:
-        o = np.array(mrc_in.header["origin"])
-        origin = np.array([o["x"], o["y"], o["z"]])
-        c = np.array(mrc_in.header["cella"])
-        cellA = np.array([c["x"], c["y"], c["z"]])
-        shape = np.array([mrc_in.header["nx"],
-                          mrc_in.header["ny"],
-                          mrc_in.header["nz"]
-                          ])
-        voxel_size = cellA / shape
-        v_context = np.full(3, context / voxel_size).astype(int) + 1
-        data_all = np.swapaxes(mrc_in.data, 0, 2)  # TODO: -low- faster wo swap
-
-    data_mask = np.zeros(shape, dtype=np.float32)
-    atoms_voxel = np.rint((atoms.positions - origin) / voxel_size)
-    for voxel in atoms_voxel.astype(int):
-        low = voxel - v_context
-        high = voxel + v_context
-        data_mask[low[0]:high[0], low[1]:high[1], low[2]:high[2]] = 1.
-
-    data = data_all * data_mask
-    data_small, v_origin_small = remove_padding(data=data)
-
-    shape_small = np.shape(data_small)
-    origin_small = origin + (v_origin_small * voxel_size)
-    center_small = np.divide(shape_small, 2).astype(int)
-
-    with mrc.new(path_out, overwrite=True) as mrc_out:
-        mrc_out.set_data(np.swapaxes(data_small, 0, 2))  # TODO
-        mrc_out._set_voxel_size(*(voxel_size))
-        mrc_out.header["origin"] = tuple(origin_small)
-
-    if star:
-        path_star = "Tomograms/seg-co/" + path_out.stem + ".star"
-        path_out_star = path_out.parent / (path_out.stem + ".star")
-        with open(path_out_star, mode="w") as star_out:
-            star_out.write(STAR_HEADER)
-            star_out.write("{} {} {} {}".format(path_star, *center_small))
-    return
+    segment_positions(positions=atoms.positions,
+                      mrc_maps=[mrc_map],
+                      paths_out=[path_out],
+                      context=context,
+                      star=star,
+                      spherical=spherical,
+                      output=output,
+                      )
 
 
 def categorise(link: Linkage,
                project: Project,
                ) -> Dict[str, Set[Tuple[FrozenSet[int], str, str]]]:
 
+    def _position_grid(link: Linkage, plus: int
+                       ) -> Tuple[np.ndarray, np.ndarray]:
+        """ Returns
+            -------
+                (helix, position, is_scaf) per resindex (n_residues, 3)
+                dense lookup grid [is_scaf, helix, position + plus] ->
+                    resindex, -1 if empty. padded by plus positions.
+        """
+        Dhps = np.array([link.DidDhps[link.FidDid[resindex]]
+                         for resindex in range(len(link.u.residues))
+                         ], dtype=int).reshape(-1, 3)
+        positions = np.array([(h, p, s) for (h, p, s), Did
+                              in link.DhpsDid.items()
+                              if Did in link.DidFid  # skips
+                              ], dtype=int).reshape(-1, 3)
+        fids = np.array([link.DidFid[Did] for Did in link.DhpsDid.values()
+                         if Did in link.DidFid
+                         ], dtype=int)
+        shape = (2, positions[:, 0].max() + 1,
+                 positions[:, 1].max() + 1 + 2 * plus)
+        grid = np.full(shape, -1, dtype=int)
+        grid[positions[:, 2], positions[:, 0], positions[:, 1] + plus] = fids
+        return Dhps, grid
+
     def _expand_selection(selection: Set[int],
-                          link: Linkage,
                           plus: int,
                           ) -> FrozenSet[int]:
-        expand = set()
-        for resindex in selection:
-            h, p, is_scaf = link.DidDhps[link.FidDid[resindex]]
-            for i in range(-plus, plus):
-                position = (h, p + i, is_scaf)
-                if position in link.DhpsDid:  # skips included as None
-                    expand.add(link.DidFid[link.DhpsDid[position]])
-        return frozenset(expand)
+        h, p, is_scaf = Dhps[np.fromiter(selection, dtype=int)].T
+        window = p[:, np.newaxis] + np.arange(-plus, plus) + plus
+        expand = grid[is_scaf[:, np.newaxis], h[:, np.newaxis], window]
+        return frozenset(np.unique(expand[expand >= 0]).tolist())
 
     categories = dict()
 
     plus = project.range
+    Dhps, grid = _position_grid(link=link, plus=plus)
     co_segment = set()
     for key, co in link.Fco.items():
         co_res = set()
@@ -131,7 +368,7 @@ def categorise(link: Linkage,
             if bp.st is not None:
                 co_res.add(bp.st.resindex)
 
-        co_res_plus = _expand_selection(selection=co_res, link=link, plus=plus)
+        co_res_plus = _expand_selection(selection=co_res, plus=plus)
         typ = "co-{}".format(co.typ)
         idf = key.strip("[]").replace(" ", "").replace(",", "-")
         identifier = idf.replace(")-(", "_").strip("()")
@@ -149,33 +386,26 @@ def categorise(link: Linkage,
         ser_bp = link.Fbp_full[ser]
         nick = set([res, ser, res_bp, ser_bp])
 
-        nick_plus = _expand_selection(selection=nick, link=link, plus=plus)
+        nick_plus = _expand_selection(selection=nick, plus=plus)
         h, p, _ = link.DidDhps[link.FidDid[res]]
         idenifier = "{}-{}".format(h, p)
         typ = "nick"
         nick_segment.add(tuple([nick_plus, idenifier, typ]))
     categories["nick"] = nick_segment
 
-    design = Design(project)
     ds_domain = set()
-    for domain in design.design.domain_list:
-        bases = domain.base_list
-        across_id = domain.connected_domain
-        is_long_ds_staple = (len(bases) >= 14
+    for domain_id, domain in link.Fdomains.items():
+        Fids, n_bases, across_id, is_scaf = domain
+        is_long_ds_staple = (n_bases >= 14
                              and across_id != -1
-                             and not bases[0].is_scaf
+                             and not is_scaf
                              )
         if not is_long_ds_staple:
             continue
         else:
-            across = design.design.domain_list[across_id]
-            bases += across.base_list
-            domain_resindices = frozenset({link.DidFid[base.id]
-                                           for base in bases
-                                           if base.id in link.DidFid  # !skip
-                                           }
-                                          )
-            idenifier = str(domain.id)
+            across_Fids = link.Fdomains[across_id][0]
+            domain_resindices = frozenset(Fids + across_Fids)
+            idenifier = str(domain_id)
             typ = "ds_domain"
             ds_domain.add(tuple([domain_resindices, idenifier, typ]))
     categories["ds"] = ds_domain
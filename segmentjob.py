@@ -0,0 +1,463 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-3#
+import mrcfile as mrc
+import numpy as np
+import attr
+import contextlib
+import tempfile
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import (
+    Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+)
+
+from utils import UnexpectedCaseError
+from mrcmap import MapCache
+from fsc import fsc_curves, fsc_resolution, FSC_THRESHOLD
+from labelvolume import LabelVolume
+from segmentation import (
+    SegmentFormat, cut_segments, segment_positions, atom_bounds,
+    write_segments
+)
+
+""" DESCR:
+    SegmentJob describes one motif cut from a set of aligned maps. the
+    segment_* runners process lists of jobs, optionally in a process pool
+    that memory-maps the maps of a shared MapCache, and write single
+    segments, label volume segments, stacks or local fsc.
+    estimate_bytes and estimate_seconds give the cost of a run beforehand.
+
+    COMMENTS:
+    jobs are run in order of their output path
+"""
+
+
+STAR_STACK_HEADER = """data_\n\nloop_\n_rlnImageName #1\n_rlnMicrographName #2
+_rlnGroupName #3\n_segName #4\n_rlnCoordinateX #5\n_rlnCoordinateY #6
+_rlnCoordinateZ #7\n_segOriginX #8\n_segOriginY #9\n_segOriginZ #10\n"""
+STAR_FSC_HEADER = """data_\n\nloop_\n_segName #1\n_rlnGroupName #2\n_segBox #3
+_segResolution #4\n"""
+
+
+@attr.s(slots=True, frozen=True)
+class SegmentJob(object):
+    """ atom positions (x, y, z) of one motif cut from the aligned maps
+        paths_in, written to paths_out. in stack mode the segments are
+        written to paths_stack instead and paths_out names the segment.
+        resindices of the motif are used by label volume segmentation.
+    """
+    positions: np.ndarray = attr.ib()
+    paths_in: Tuple[Path, ...] = attr.ib(converter=tuple)
+    paths_out: Tuple[Path, ...] = attr.ib(converter=tuple)
+    paths_stack: Tuple[Path, ...] = attr.ib(default=(), converter=tuple)
+    typ: str = attr.ib(default="")
+    resindices: Tuple[int, ...] = attr.ib(default=(), converter=tuple)
+
+
+# maps of a worker process, opened once per process
+_worker_maps: Optional[MapCache] = None
+
+
+def _init_worker(aliases: Dict[Path, Path]) -> None:
+    """ aliases: binned maps written by the parent (MapCache.shared)
+    """
+    global _worker_maps
+    _worker_maps = MapCache(aliases=aliases)
+
+
+def _run_job(job: SegmentJob,
+             context: int,
+             star: bool,
+             spherical: bool,
+             output: SegmentFormat,
+             ) -> Path:
+    segment_positions(positions=job.positions,
+                      mrc_maps=[_worker_maps[path] for path in job.paths_in],
+                      paths_out=job.paths_out,
+                      context=context,
+                      star=star,
+                      spherical=spherical,
+                      output=output,
+                      )
+    return job.paths_out[0]
+
+
+def _run_cut(job: SegmentJob,
+             context: int,
+             spherical: bool,
+             ) -> Tuple[List[np.ndarray], np.ndarray]:
+    return cut_segments(positions=job.positions,
+                        mrc_maps=[_worker_maps[p] for p in job.paths_in],
+                        context=context,
+                        spherical=spherical,
+                        )
+
+
+def _check_jobs(jobs: List[SegmentJob], maps: MapCache
+                ) -> List[SegmentJob]:
+    """ Returns
+        -------
+            jobs in order of their output path
+    """
+    if any(not len(job.positions) for job in jobs):
+        raise UnexpectedCaseError("no atoms in this selection")
+    for paths_in in {job.paths_in for job in jobs}:
+        for path in paths_in[1:]:
+            if not maps[paths_in[0]].same_grid(maps[path]):
+                raise UnexpectedCaseError(
+                    "{} and {} are not on the same grid".format(
+                        paths_in[0], path))
+    return sorted(jobs, key=lambda job: str(job.paths_out[0]))
+
+
+def _report(jobs: List[SegmentJob], results: Iterable[Any]
+            ) -> Iterator[Tuple[SegmentJob, Any]]:
+    report = max(len(jobs) // 20, 1)
+    for i, (job, result) in enumerate(zip(jobs, results), 1):
+        if i % report == 0 or i == len(jobs):
+            print("segmented {}/{} {}".format(i, len(jobs),
+                                              job.paths_out[0].name))
+        yield job, result
+
+
+@contextlib.contextmanager
+def _map_jobs(function: Callable[[SegmentJob], Any],
+              jobs: List[SegmentJob],
+              workers: int,
+              maps: MapCache,
+              ) -> Iterator[Iterator[Tuple[SegmentJob, Any]]]:
+    """ context of (job, result) in order of jobs, computed in a process pool
+        if workers > 1. maps are memory-mapped by every process and shared
+        via the page cache of the os, binned maps are binned once by the
+        parent and memory-mapped from a temporary file. a single process uses
+        maps. the pool is shut down on exit, also if a job or the caller
+        raises.
+    """
+    global _worker_maps
+    pool = None
+    if workers > 1:
+        aliases = maps.shared(path for job in jobs for path in job.paths_in)
+        pool = ProcessPoolExecutor(max_workers=workers,
+                                   initializer=_init_worker,
+                                   initargs=(aliases,),
+                                   )
+        chunksize = max(len(jobs) // (4 * workers), 1)
+        results = pool.map(function, jobs, chunksize=chunksize)
+    else:
+        _worker_maps = maps
+        results = map(function, jobs)
+
+    try:
+        yield _report(jobs, results)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        else:
+            _worker_maps = None
+
+
+def _job_boxes(jobs: List[SegmentJob], context: int, maps: MapCache
+               ) -> List[int]:
+    """ upper bound of the cubic box edge [voxel] of every job. only the
+        map geometry is used, binned data is not computed.
+    """
+    boxes = list()
+    for job in jobs:
+        low, high = atom_bounds(job.positions, maps[job.paths_in[0]],
+                                context)
+        boxes.append(int(np.max(high - low)))
+    return boxes
+
+
+def estimate_bytes(jobs: List[SegmentJob],
+                   maps: MapCache,
+                   context: int = 3,
+                   stack: bool = False,
+                   output: SegmentFormat = SegmentFormat(),
+                   ) -> int:
+    """ upper bound of the uncompressed size of all segments of the jobs,
+        one file per segment or one stack per stack path
+    """
+    boxes = _job_boxes(jobs, context, maps)
+    if not stack:
+        return sum(output.nbytes((box, box, box)) * len(job.paths_out)
+                   for job, box in zip(jobs, boxes))
+    stacks: Dict[Path, Tuple[int, int]] = dict()
+    for job, box in zip(jobs, boxes):
+        for path_stack in job.paths_stack:
+            n, box_stack = stacks.get(path_stack, (0, 0))
+            stacks[path_stack] = (n + 1, max(box_stack, box))
+    return sum(output.nbytes((n, box, box, box))
+               for n, box in stacks.values())
+
+
+def _sample_jobs(jobs: List[SegmentJob], sample: int) -> List[SegmentJob]:
+    return jobs[::max(len(jobs) // sample, 1)][:sample]
+
+
+def estimate_seconds(jobs: List[SegmentJob],
+                     maps: MapCache,
+                     context: int = 3,
+                     spherical: bool = False,
+                     workers: int = 1,
+                     stack: bool = False,
+                     volume: Optional[LabelVolume] = None,
+                     fsc_jobs: Optional[List[SegmentJob]] = None,
+                     output: SegmentFormat = SegmentFormat(),
+                     sample: int = 3,
+                     ) -> float:
+    """ runtime of the segmentation extrapolated from an evenly spaced
+        sample of jobs, cut the way the run cuts them (label volume, stack or
+        single segments). the sample is written to a temporary folder, the
+        write cost per byte is scaled to estimate_bytes. fsc_jobs adds the
+        local fsc pass. cutting is divided by workers (one process for the
+        label volume), writes are counted serial.
+    """
+    seconds = 0.
+    if fsc_jobs:
+        start = time.perf_counter()
+        for job in _sample_jobs(fsc_jobs, sample):
+            segments, _ = cut_segments(
+                positions=job.positions,
+                mrc_maps=[maps[path] for path in job.paths_in],
+                context=context,
+                spherical=spherical,
+            )
+            fsc_curves(_pad_batch(segments[:1]), _pad_batch(segments[1:]))
+        per_job = (time.perf_counter() - start) / min(len(fsc_jobs), sample)
+        seconds += per_job * len(fsc_jobs) / max(workers, 1)
+    if not jobs:
+        return seconds
+
+    # stacks are written memory-mapped and uncompressed
+    write_format = attr.evolve(output, compress=False) if stack else output
+    picked = _sample_jobs(jobs, sample)
+    t_cut, t_write, n_written = 0., 0., 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for i, job in enumerate(picked):
+            mrc_maps = [maps[path] for path in job.paths_in]
+            start = time.perf_counter()
+            if volume is not None:
+                segments, v_origin = volume.cut(resindices=job.resindices,
+                                                mrc_maps=mrc_maps,
+                                                )
+            else:
+                segments, v_origin = cut_segments(positions=job.positions,
+                                                  mrc_maps=mrc_maps,
+                                                  context=context,
+                                                  spherical=spherical,
+                                                  )
+            t_cut += time.perf_counter() - start
+            start = time.perf_counter()
+            write_segments(segments=segments,
+                           v_origin_small=v_origin,
+                           mrc_map=mrc_maps[0],
+                           paths_out=[Path(tmp) / "{}_{}.mrc".format(i, j)
+                                      for j in range(len(segments))],
+                           output=write_format,
+                           )
+            t_write += time.perf_counter() - start
+            n_written += sum(write_format.nbytes(segment.shape)
+                             for segment in segments)
+
+    processes = 1 if volume is not None else max(workers, 1)
+    seconds += t_cut / len(picked) * len(jobs) / processes
+    n_bytes = estimate_bytes(jobs=jobs, maps=maps, context=context,
+                             stack=stack, output=output)
+    return seconds + t_write / max(n_written, 1) * n_bytes
+
+
+def segment_jobs(jobs: List[SegmentJob],
+                 maps: MapCache,
+                 context: int = 3,
+                 star: bool = False,
+                 spherical: bool = False,
+                 workers: int = 1,
+                 output: SegmentFormat = SegmentFormat(),
+                 ) -> None:
+    """ run all jobs, one map file (and star file) per segment
+    """
+    jobs = _check_jobs(jobs, maps)
+    run = partial(_run_job, context=context, star=star, spherical=spherical,
+                  output=output)
+    with _map_jobs(run, jobs, workers, maps) as results:
+        for _ in results:
+            pass
+
+
+def segment_labels(jobs: List[SegmentJob],
+                   maps: MapCache,
+                   volume: LabelVolume,
+                   star: bool = False,
+                   output: SegmentFormat = SegmentFormat(),
+                   ) -> None:
+    """ run all jobs from one label volume: every segment holds the voxels
+        closest to the residues of the motif, one map file per segment
+    """
+    jobs = _check_jobs(jobs, maps)
+    report = max(len(jobs) // 20, 1)
+    for i, job in enumerate(jobs, 1):
+        mrc_maps = [maps[path] for path in job.paths_in]
+        segments, v_origin_small = volume.cut(resindices=job.resindices,
+                                              mrc_maps=mrc_maps,
+                                              )
+        write_segments(segments=segments,
+                       v_origin_small=v_origin_small,
+                       mrc_map=mrc_maps[0],
+                       paths_out=job.paths_out,
+                       star=star,
+                       output=output,
+                       )
+        if i % report == 0 or i == len(jobs):
+            print("segmented {}/{} {}".format(i, len(jobs),
+                                              job.paths_out[0].name))
+
+
+def segment_stacks(jobs: List[SegmentJob],
+                   maps: MapCache,
+                   path_star: Path,
+                   context: int = 3,
+                   spherical: bool = False,
+                   workers: int = 1,
+                   output: SegmentFormat = SegmentFormat(),
+                   ) -> None:
+    """ run all jobs, all segments of a stack path are padded to a common
+        cubic box and written to one volume stack (.mrcs). path_star indexes
+        every segment of all stacks with its centre (voxel of the input map)
+        and the origin of its box [A]. stacks are written memory-mapped,
+        output.compress does not apply.
+    """
+    jobs = _check_jobs(jobs, maps)
+
+    # common box per stack: upper bound from the atom bounds of each job
+    boxes: Dict[Path, int] = dict()
+    stacks: Dict[Path, List[SegmentJob]] = dict()
+    for job, job_box in zip(jobs, _job_boxes(jobs, context, maps)):
+        for path_stack in job.paths_stack:
+            boxes[path_stack] = max(boxes.get(path_stack, 0), job_box)
+            stacks.setdefault(path_stack, list()).append(job)
+    voxel_size = maps[jobs[0].paths_in[0]].voxel_size
+    origin = maps[jobs[0].paths_in[0]].origin
+
+    mrcs = dict()
+    for path_stack, box in boxes.items():
+        shape = (len(stacks[path_stack]), box, box, box)
+        mrcs[path_stack] = mrc.new_mmap(str(path_stack), shape=shape,
+                                        mrc_mode=output.mrc_mode,
+                                        overwrite=True)
+        mrcs[path_stack]._set_voxel_size(*(voxel_size))
+    index = {(path_stack, job.paths_out[0]): i
+             for path_stack, stack_jobs in stacks.items()
+             for i, job in enumerate(stack_jobs)
+             }
+
+    star_rows = list()
+    run = partial(_run_cut, context=context, spherical=spherical)
+    with _map_jobs(run, jobs, workers, maps) as results:
+        for job, (segments, v_origin) in results:
+            for data_small, path_in, path_out, path_stack in zip(
+                    segments, job.paths_in, job.paths_out, job.paths_stack):
+                box = boxes[path_stack]
+                s_cell = data_small.shape[0]
+                offset = (box - s_cell) // 2
+                i = index[(path_stack, job.paths_out[0])]
+                mrcs[path_stack].data[i,
+                                      offset:offset + s_cell,
+                                      offset:offset + s_cell,
+                                      offset:offset + s_cell,
+                                      ] = data_small
+                v_box = v_origin - offset
+                path_rel = path_stack.relative_to(path_star.parent)
+                star_rows.append((
+                    "{:06d}@{}".format(i + 1, path_rel),
+                    path_in.name,
+                    job.typ,
+                    path_out.stem,
+                    *(v_box + box // 2),
+                    *(origin + v_box * voxel_size),
+                ))
+
+    for stack in mrcs.values():
+        stack.update_header_stats()
+        stack.close()
+
+    with open(path_star, mode="w") as star_out:
+        star_out.write(STAR_STACK_HEADER)
+        for row in sorted(star_rows, key=lambda r: r[0].split("@")[::-1]):
+            star_out.write(
+                "{} {} {} {} {} {} {} {:.3f} {:.3f} {:.3f}\n".format(*row))
+
+
+def _pad_batch(segments: List[np.ndarray]) -> np.ndarray:
+    """ cubic segments centred in the largest box of the batch (n, b, b, b)
+    """
+    box = max(segment.shape[0] for segment in segments)
+    batch = np.zeros((len(segments), box, box, box), dtype=np.float32)
+    for i, segment in enumerate(segments):
+        s_cell = segment.shape[0]
+        offset = (box - s_cell) // 2
+        batch[i,
+              offset:offset + s_cell,
+              offset:offset + s_cell,
+              offset:offset + s_cell,
+              ] = segment
+    return batch
+
+
+def segment_fsc(jobs: List[SegmentJob],
+                maps: MapCache,
+                path_star: Path,
+                context: int = 3,
+                spherical: bool = False,
+                workers: int = 1,
+                batch: int = 32,
+                threshold: float = FSC_THRESHOLD,
+                ) -> Dict[str, float]:
+    """ local resolution of every job from the FSC of its two half maps
+        (paths_in) under the shared segment mask. segments are kept in
+        memory and transformed in batches of segments of the same box, the
+        resolution of a segment depends on its own box only. path_star lists
+        resolution [A] per segment (named by paths_out[0]).
+        Returns
+        -------
+            resolution [A] per segment name
+    """
+    jobs = _check_jobs(jobs, maps)
+    if any(len(job.paths_in) != 2 for job in jobs):
+        raise UnexpectedCaseError("local fsc needs exactly two half maps")
+    voxel_size = float(maps[jobs[0].paths_in[0]].voxel_size[0])
+
+    rows: Dict[int, Tuple[str, str, int, float]] = dict()
+    pending: Dict[int, List[Tuple[int, SegmentJob, List[np.ndarray]]]] = (
+        dict())
+
+    def flush(box: int) -> None:
+        batch_jobs = pending.pop(box)
+        half1 = np.stack([segments[0] for _, _, segments in batch_jobs])
+        half2 = np.stack([segments[1] for _, _, segments in batch_jobs])
+        resolution = fsc_resolution(fsc=fsc_curves(half1, half2),
+                                    box=box,
+                                    voxel_size=voxel_size,
+                                    threshold=threshold,
+                                    )
+        for (i, job, _), res in zip(batch_jobs, resolution):
+            rows[i] = (job.paths_out[0].stem, job.typ, box, float(res))
+
+    run = partial(_run_cut, context=context, spherical=spherical)
+    with _map_jobs(run, jobs, workers, maps) as results:
+        for i, (job, (segments, _)) in enumerate(results):
+            box = segments[0].shape[0]
+            pending.setdefault(box, list()).append((i, job, segments))
+            if len(pending[box]) == batch:
+                flush(box)
+    for box in list(pending):
+        flush(box)
+
+    with open(path_star, mode="w") as star_out:
+        star_out.write(STAR_FSC_HEADER)
+        for i in sorted(rows):
+            star_out.write("{} {} {} {:.3f}\n".format(*rows[i]))
+    return {name: res for name, _, _, res in rows.values()}
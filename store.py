@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-3#
+import os
+import pickle
+import numpy as np
+import attr
+
+from pathlib import Path
+from typing import Dict, Tuple, Any, List
+
+from linkage import Linkage
+from utils import _flatten, _unflatten, UnexpectedCaseError
+
+""" DESCR:
+    RunStore Class is the append-able analysis store of one FitAnalyse run.
+    Every property is a memory-mapped .npy array (frames, keys, features).
+    meta.p holds keys and features per property, trajectory frame and time
+    of every stored frame and the hash of the linkage. a feature is the key
+    path of a leaf and its vector component (utils._flatten).
+
+    COMMENTS:
+    store folder: analysis/{name}__store/
+    meta.p is written after the arrays, frames beyond meta["frames"] are not
+    valid.
+"""
+
+
+@attr.s
+class RunStore(object):
+    path: Path = attr.ib()
+    capacity: int = attr.ib(default=1)
+
+    def __attrs_post_init__(self) -> None:
+        self.path.mkdir(exist_ok=True)
+        self.arrays: Dict[str, np.ndarray] = dict()
+        path_meta = self.path / "meta.p"
+        if path_meta.exists():
+            self.meta: Dict[str, Any] = pickle.load(open(path_meta, "rb"))
+        else:
+            self.meta = {"linkage": None,
+                         "frames": list(),
+                         "time": list(),
+                         "properties": dict(),
+                         }
+
+    @classmethod
+    def new(cls, path: Path, capacity: int = 1) -> "RunStore":
+        """ empty store, removes previous content of path
+        """
+        if path.exists():
+            for content in path.iterdir():
+                if content.suffix in [".npy", ".p"]:
+                    os.remove(content)
+        return cls(path=path, capacity=capacity)
+
+    @property
+    def n_frames(self) -> int:
+        return len(self.meta["frames"])
+
+    def truncate(self, n_frames: int) -> None:
+        """ discard stored frames beyond n_frames, they are overwritten
+        """
+        del self.meta["frames"][n_frames:]
+        del self.meta["time"][n_frames:]
+        pickle.dump(self.meta, open(self.path / "meta.p", "wb"))
+
+    def check_linkage(self, link: Linkage) -> None:
+        link_hash = link.hash()
+        if self.meta["linkage"] is None:
+            self.meta["linkage"] = link_hash
+        elif self.meta["linkage"] != link_hash:
+            raise UnexpectedCaseError(
+                "store {} belongs to a different linkage".format(self.path))
+
+    def _array_path(self, prop_name: str) -> Path:
+        return self.path / "{}.npy".format(prop_name)
+
+    def _create(self, prop_name: str, shape: Tuple[int, ...]) -> np.ndarray:
+        array = np.lib.format.open_memmap(self._array_path(prop_name),
+                                          mode="w+",
+                                          dtype=np.float32,
+                                          shape=shape,
+                                          )
+        array[:] = np.nan
+        return array
+
+    def _grow(self, prop_name: str, n_frames: int) -> np.ndarray:
+        old = self.arrays.pop(prop_name)
+        shape = (max(2 * old.shape[0], n_frames), *old.shape[1:])
+        path_old = self._array_path(prop_name).with_suffix(".old")
+        old.flush()
+        del old
+        os.replace(self._array_path(prop_name), path_old)
+        old = np.load(path_old, mmap_mode="r")
+        array = self._create(prop_name, shape)
+        array[:old.shape[0]] = old
+        del old
+        os.remove(path_old)
+        return array
+
+    def _get_array(self, prop_name: str, n_frames: int) -> np.ndarray:
+        if prop_name not in self.arrays:
+            self.arrays[prop_name] = np.load(self._array_path(prop_name),
+                                             mmap_mode="r+")
+        if self.arrays[prop_name].shape[0] < n_frames:
+            self.arrays[prop_name] = self._grow(prop_name, n_frames)
+        return self.arrays[prop_name]
+
+    def append(self, frame: int, time: float,
+               props: Dict[str, Tuple[Dict[Any, Any], List[Any]]],
+               ) -> int:
+        """ props: property name -> (property dict, keys)
+            keys and features of a property are fixed by its first frame
+        """
+        i = self.n_frames
+        for prop_name, (prop, keys) in props.items():
+            info = self.meta["properties"].get(prop_name, None)
+            if info is None:
+                features, values = _flatten(prop, keys)
+                info = {"keys": list(keys), "features": features}
+                self.meta["properties"][prop_name] = info
+                shape = (max(self.capacity, i + 1), *values.shape)
+                self.arrays[prop_name] = self._create(prop_name, shape)
+            else:
+                _, values = _flatten(prop, info["keys"], info["features"])
+            array = self._get_array(prop_name, i + 1)
+            array[i] = values
+
+        for array in self.arrays.values():
+            array.flush()
+        self.meta["frames"].append(int(frame))
+        self.meta["time"].append(float(time))
+        pickle.dump(self.meta, open(self.path / "meta.p", "wb"))
+        return i
+
+    def read(self, prop_name: str, frames: Any = slice(None)
+             ) -> Tuple[List[Any], List[str], np.ndarray]:
+        """ Returns
+            -------
+                keys, features, values (selected frames, keys, features)
+        """
+        info = self.meta["properties"][prop_name]
+        array = np.load(self._array_path(prop_name), mmap_mode="r")
+        values = array[:self.n_frames][frames]
+        return info["keys"], info["features"], values
+
+    def frame_dict(self, prop_name: str, i: int) -> Dict[Any, Any]:
+        """ property of stored frame i as nested dict. keys without any
+            value are skipped.
+        """
+        keys, features, values = self.read(prop_name, i)
+        return {key: _unflatten(features, row)
+                for key, row in zip(keys, values)
+                if not np.all(np.isnan(row))
+                }
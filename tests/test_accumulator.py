@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-3#
+import sys
+import warnings
+import numpy as np
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from accumulator import RunningStatistics, TrajectoryAccumulator  # noqa
+
+
+def test_fit_score_histogram_spread():
+    """ cc and q in [-1, 1] are spread over the bins, not in one bin
+    """
+    rng = np.random.default_rng(0)
+    accumulator = TrajectoryAccumulator(bins=6)
+    keys = list(range(50))
+    for prop_name in ["fit_score", "motif_score"]:
+        for _ in range(20):
+            prop = {key: {"cc": rng.uniform(-1., 1.),
+                          "q": rng.uniform(-1., 1.),
+                          }
+                    for key in keys
+                    }
+            accumulator.add(prop_name, prop, keys)
+
+    summary = accumulator.summary()
+    for prop_name in ["fit_score", "motif_score"]:
+        edges = summary[prop_name]["edges"]
+        assert np.allclose(edges[..., 0], -1.)
+        assert np.allclose(edges[..., -1], 1.)
+        counts = summary[prop_name]["hist"].sum(axis=0)
+        assert np.all(counts > 0)
+        assert np.all(counts.max(axis=-1) < counts.sum(axis=-1))
+
+
+def test_running_statistics_match_numpy():
+    """ streamed count, mean, var, min, max and histogram equal the
+        statistics of all frames at once, nan values are ignored
+    """
+    rng = np.random.default_rng(1)
+    frames = rng.normal(5., 20., size=(200, 4, 3))
+    frames[rng.uniform(size=frames.shape) < 0.2] = np.nan
+    frames[:, 0, 0] = np.nan
+
+    statistics = RunningStatistics(shape=(4, 3), bins=8)
+    for values in frames:
+        statistics.update(values)
+    summary = statistics.summary()
+
+    assert np.array_equal(summary["count"], np.sum(~np.isnan(frames), axis=0))
+    with warnings.catch_warnings():
+        # all-nan slice of the reference
+        warnings.simplefilter("ignore", RuntimeWarning)
+        assert np.allclose(summary["mean"], np.nanmean(frames, axis=0),
+                           equal_nan=True)
+        assert np.allclose(summary["var"], np.nanvar(frames, axis=0, ddof=1),
+                           equal_nan=True)
+        assert np.allclose(summary["min"], np.nanmin(frames, axis=0),
+                           equal_nan=True)
+        assert np.allclose(summary["max"], np.nanmax(frames, axis=0),
+                           equal_nan=True)
+
+    clipped = np.clip(frames, -180., 180. - 1e-9)
+    for k in range(4):
+        for f in range(3):
+            column = clipped[:, k, f]
+            hist, _ = np.histogram(column[~np.isnan(column)], bins=8,
+                                   range=(-180., 180.))
+            assert np.array_equal(summary["hist"][k, f], hist)
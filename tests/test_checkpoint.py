@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-3#
+import sys
+import pickle
+import numpy as np
+import pytest
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "benchmarks"))
+import FitAnalyse  # noqa: E402
+from bdna import BDna, METRICS  # noqa: E402
+from synthetic import generate, SyntheticLinker, synthetic_project  # noqa
+
+N_FRAMES = 6
+
+
+class Interrupt(Exception):
+    pass
+
+
+@pytest.fixture(scope="module")
+def synthetic(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("synthetic")
+    origami = generate(folder=folder, name="syn", n_helices=2, length=64,
+                       n_frames=N_FRAMES)
+    return folder, origami
+
+
+def _run(synthetic, output, interrupt_at=None, **options):
+    """ analyse all frames into output. interrupt_at: raise when the frame
+        with this index is analysed
+    """
+    folder, origami = synthetic
+    project = synthetic_project(folder=folder, name="syn",
+                                frames=N_FRAMES, checkpoint=2,
+                                metrics=list(METRICS), **options)
+    project.output = output
+    output.mkdir(exist_ok=True)
+    link = SyntheticLinker(project=project, origami=origami).create_linkage()
+
+    calls = {"n": 0}
+
+    class InterruptedBDna(BDna):
+        def sample(self, *args, **kwargs):
+            if calls["n"] == interrupt_at:
+                raise Interrupt()
+            calls["n"] += 1
+            return super().sample(*args, **kwargs)
+
+    FitAnalyse.BDna = InterruptedBDna
+    try:
+        FitAnalyse.analyse(project, link)
+    finally:
+        FitAnalyse.BDna = BDna
+
+
+def _assert_equal_arrays(path_full, path_resumed):
+    names = sorted(p.name for p in path_full.glob("*.npy"))
+    assert names == sorted(p.name for p in path_resumed.glob("*.npy"))
+    for name in names:
+        full = np.load(path_full / name)
+        resumed = np.load(path_resumed / name)
+        assert np.array_equal(full, resumed, equal_nan=True), name
+    meta_full = pickle.load(open(path_full / "meta.p", "rb"))
+    meta_resumed = pickle.load(open(path_resumed / "meta.p", "rb"))
+    assert meta_full == meta_resumed
+
+
+def _assert_equal_summary(full, resumed):
+    if isinstance(full, dict):
+        assert full.keys() == resumed.keys()
+        for key in full:
+            _assert_equal_summary(full[key], resumed[key])
+    elif isinstance(full, np.ndarray):
+        assert np.array_equal(full, resumed, equal_nan=True)
+    else:
+        assert full == resumed
+
+
+def test_resume_store(synthetic, tmp_path):
+    """ store and atomprops of an interrupted and resumed run equal the
+        outputs of an uninterrupted run
+    """
+    _run(synthetic, tmp_path / "full", pdb=True)
+    with pytest.raises(Interrupt):
+        _run(synthetic, tmp_path / "resumed", interrupt_at=3, pdb=True)
+    _run(synthetic, tmp_path / "resumed", resume=True, pdb=True)
+
+    for folder in ["syn__store", "syn__atomprops"]:
+        _assert_equal_arrays(tmp_path / "full" / folder,
+                             tmp_path / "resumed" / folder)
+
+
+def test_resume_accumulator(synthetic, tmp_path):
+    """ running statistics of an interrupted and resumed run equal the
+        statistics of an uninterrupted run
+    """
+    _run(synthetic, tmp_path / "full", accumulate=True, bins=4)
+    with pytest.raises(Interrupt):
+        _run(synthetic, tmp_path / "resumed", interrupt_at=3,
+             accumulate=True, bins=4)
+    _run(synthetic, tmp_path / "resumed", resume=True, accumulate=True,
+         bins=4)
+
+    path_summary = "syn__bDNA-summary.p"
+    full = pickle.load(open(tmp_path / "full" / path_summary, "rb"))
+    resumed = pickle.load(open(tmp_path / "resumed" / path_summary, "rb"))
+    _assert_equal_summary(full, resumed)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-3#
+import sys
+import numpy as np
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from fsc import fsc_curves, fsc_resolution  # noqa: E402
+
+
+def test_fsc_identical_halves():
+    """ identical half maps correlate in every shell, resolution at nyquist
+    """
+    rng = np.random.default_rng(0)
+    half = rng.normal(size=(2, 16, 16, 16))
+    fsc = fsc_curves(half, half)
+    assert np.allclose(fsc, 1.)
+    resolution = fsc_resolution(fsc, box=16, voxel_size=1.5)
+    assert np.allclose(resolution, 2 * 1.5)
+
+
+def test_fsc_matches_loop():
+    """ batched curves equal a per-shell loop over one pair
+    """
+    rng = np.random.default_rng(1)
+    box = 12
+    signal = rng.normal(size=(box, box, box))
+    half1 = signal + rng.normal(size=signal.shape)
+    half2 = signal + rng.normal(size=signal.shape)
+    fsc = fsc_curves(half1[np.newaxis], half2[np.newaxis])[0]
+
+    f1, f2 = np.fft.rfftn(half1), np.fft.rfftn(half2)
+    k = np.fft.fftfreq(box) * box
+    kx = np.fft.rfftfreq(box) * box
+    radius = np.rint(np.sqrt(k[:, None, None]**2 + k[None, :, None]**2
+                             + kx[None, None, :]**2)).astype(int)
+    for shell in range(box // 2 + 1):
+        sel = radius == shell
+        expected = (np.sum(np.real(f1[sel] * np.conj(f2[sel])))
+                    / np.sqrt(np.sum(np.abs(f1[sel])**2)
+                              * np.sum(np.abs(f2[sel])**2)))
+        assert np.isclose(fsc[shell], expected)
+
+
+def test_fsc_resolution_crossing():
+    """ linear interpolation between the shells around the crossing.
+        crossing before the first shell is unresolved (nan), not larger
+        than the box
+    """
+    fsc = np.array([[1., 0.9, 0.5, 0.1, 0.0],
+                    [1., 0.1, 0.0, 0.0, 0.0],
+                    [0.1, 0.0, 0.0, 0.0, 0.0],
+                    ])
+    resolution = fsc_resolution(fsc, box=8, voxel_size=2.)
+    fraction = (0.5 - 0.143) / (0.5 - 0.1)
+    assert np.isclose(resolution[0], 16. / (2 + fraction))
+    assert np.all(np.isnan(resolution[1:]))
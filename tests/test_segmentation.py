@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-3#
+import sys
+import itertools
+import numpy as np
+import pytest
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from segmentation import atom_mask, csr_rows  # noqa: E402
+
+SHAPE = (14, 17, 15)
+VOXEL_SIZE = np.array([1.0, 1.2, 0.9])
+
+
+def _atom_voxels(rng, n_atoms=12):
+    # includes voxels at and outside the map border
+    return rng.integers(-2, np.array(SHAPE) + 2, size=(n_atoms, 3))
+
+
+def _cube_loop(voxels, context):
+    """ cube mask of the original per-atom loop, clipped at the map border
+    """
+    v_context = np.full(3, context / VOXEL_SIZE).astype(int) + 1
+    mask = np.zeros(SHAPE, dtype=bool)
+    for voxel in voxels:
+        low = np.maximum(voxel - v_context, 0)
+        high = voxel + v_context
+        mask[low[0]:high[0], low[1]:high[1], low[2]:high[2]] = True
+    return mask
+
+
+def _ball_loop(voxels, context):
+    """ all voxels within context [A] of an atom voxel
+    """
+    v_context = np.full(3, context / VOXEL_SIZE).astype(int) + 1
+    mask = np.zeros(SHAPE, dtype=bool)
+    ranges = [range(-v, v + 1) for v in v_context]
+    for offset in itertools.product(*ranges):
+        if np.sum((np.array(offset) * VOXEL_SIZE)**2) > context**2:
+            continue
+        shifted = voxels + offset
+        inside = np.all((shifted >= 0) & (shifted < SHAPE), axis=1)
+        mask[tuple(shifted[inside].T)] = True
+    return mask
+
+
+@pytest.mark.parametrize("context", [1.5, 3.3, 5.])
+def test_atom_mask_cube(context):
+    voxels = _atom_voxels(np.random.default_rng(0))
+    mask = atom_mask(voxels=voxels, shape=SHAPE, context=context,
+                     voxel_size=VOXEL_SIZE)
+    assert np.array_equal(mask, _cube_loop(voxels, context))
+
+
+@pytest.mark.parametrize("context", [1.5, 3.3, 5.])
+def test_atom_mask_spherical(context):
+    voxels = _atom_voxels(np.random.default_rng(1))
+    mask = atom_mask(voxels=voxels, shape=SHAPE, context=context,
+                     voxel_size=VOXEL_SIZE, spherical=True)
+    assert np.array_equal(mask, _ball_loop(voxels, context))
+
+
+def test_csr_rows():
+    """ rows of a CSR table equal a boolean selection per row, in order of
+        row. duplicate and empty rows are handled
+    """
+    rng = np.random.default_rng(2)
+    n_rows = 20
+    labels = rng.integers(0, n_rows, size=300)
+    labels[labels == 7] = 3  # empty row 7
+    order = np.argsort(labels, kind="stable")
+    counts = np.bincount(labels, minlength=n_rows)
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    rows = [12, 3, 7, 12, 0, 19]
+    expected = np.concatenate([np.flatnonzero(labels == r)
+                               for r in sorted(set(rows))])
+    assert np.array_equal(csr_rows(order, offsets, counts, rows), expected)
+    assert len(csr_rows(order, offsets, counts, [7])) == 0
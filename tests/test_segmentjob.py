@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-3#
+import sys
+import multiprocessing
+import mrcfile as mrc
+import numpy as np
+import pytest
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from mrcmap import MapCache  # noqa: E402
+from segmentjob import SegmentJob, segment_fsc, segment_jobs  # noqa: E402
+
+
+def _write_halfmaps(path: Path) -> list:
+    rng = np.random.default_rng(0)
+    signal = rng.normal(size=(40, 40, 40)).astype(np.float32)
+    paths = list()
+    for i in range(2):
+        path_map = path / "half{}.mrc".format(i + 1)
+        noise = rng.normal(size=signal.shape).astype(np.float32)
+        with mrc.new(path_map, overwrite=True) as mrc_out:
+            mrc_out.set_data(signal + noise)
+            mrc_out.voxel_size = 1.
+        paths.append(path_map)
+    return paths
+
+
+def test_segment_fsc_independent_of_batch(tmp_path):
+    """ the resolution of a motif does not depend on the other motifs of
+        its batch
+    """
+    paths_in = _write_halfmaps(tmp_path)
+    rng = np.random.default_rng(1)
+    jobs = list()
+    for i, n_atoms in enumerate([3, 8, 20, 5]):
+        center = rng.uniform(12., 28., size=3)
+        positions = center + rng.uniform(-4., 4., size=(n_atoms, 3))
+        jobs.append(SegmentJob(positions=positions,
+                               paths_in=paths_in,
+                               paths_out=[tmp_path / "m{}.mrc".format(i)],
+                               ))
+
+    results = list()
+    for batch in [1, 32]:
+        with MapCache() as maps:
+            results.append(segment_fsc(jobs=jobs,
+                                       maps=maps,
+                                       path_star=tmp_path / "fsc.star",
+                                       batch=batch,
+                                       ))
+    assert results[0].keys() == results[1].keys()
+    for name, res in results[0].items():
+        assert np.isclose(res, results[1][name], equal_nan=True)
+
+
+def test_segment_jobs_workers(tmp_path):
+    """ segments of a process pool equal the segments of one process
+    """
+    paths_in = _write_halfmaps(tmp_path)
+    rng = np.random.default_rng(2)
+    positions = [rng.uniform(10., 30., size=(6, 3)) for _ in range(4)]
+    for workers in [1, 2]:
+        jobs = [SegmentJob(positions=pos,
+                           paths_in=paths_in[:1],
+                           paths_out=[tmp_path / "w{}_{}.mrc".format(workers,
+                                                                     i)],
+                           )
+                for i, pos in enumerate(positions)
+                ]
+        with MapCache() as maps:
+            segment_jobs(jobs=jobs, maps=maps, workers=workers)
+    for i in range(4):
+        with mrc.open(tmp_path / "w1_{}.mrc".format(i)) as m1, \
+                mrc.open(tmp_path / "w2_{}.mrc".format(i)) as m2:
+            assert np.array_equal(m1.data, m2.data)
+
+
+def test_segment_jobs_pool_shutdown_on_error(tmp_path):
+    """ a failing job shuts down the worker processes
+    """
+    jobs = [SegmentJob(positions=np.zeros((1, 3)),
+                       paths_in=[tmp_path / "missing.mrc"],
+                       paths_out=[tmp_path / "m{}.mrc".format(i)],
+                       )
+            for i in range(4)
+            ]
+    with MapCache() as maps:
+        with pytest.raises(FileNotFoundError):
+            segment_jobs(jobs=jobs, maps=maps, workers=2)
+    assert not multiprocessing.active_children()
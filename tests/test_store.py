@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-3#
+import sys
+import numpy as np
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from store import RunStore  # noqa: E402
+
+
+def _frame_props(rng):
+    keys = [0, 1, 2]
+    prop = {key: {"rise": rng.uniform(3., 4.),
+                  "plane": {"n0": rng.normal(size=3)},
+                  }
+            for key in keys[:2]  # key 2 without value
+            }
+    counts = {"dev0.1": float(rng.integers(10))}
+    return {"bp": (prop, keys), "counts": (counts, list(counts))}
+
+
+def _assert_equal(stored, written):
+    assert stored.keys() == written.keys()
+    for key, value in written.items():
+        if isinstance(value, dict):
+            _assert_equal(stored[key], value)
+        else:
+            assert np.allclose(stored[key], value)
+
+
+def test_store_round_trip(tmp_path):
+    """ nested properties with vector leaves read back per frame, also
+        after the arrays grew beyond the capacity and the store is reopened
+    """
+    rng = np.random.default_rng(0)
+    path = tmp_path / "store"
+    store = RunStore.new(path=path, capacity=2)
+    written = list()
+    for frame in range(5):
+        props = _frame_props(rng)
+        store.append(frame=10 * frame, time=0.5 * frame, props=props)
+        written.append(props)
+
+    store = RunStore(path=path)
+    assert store.n_frames == 5
+    assert store.meta["frames"] == [0, 10, 20, 30, 40]
+    for i, props in enumerate(written):
+        for prop_name, (prop, _) in props.items():
+            _assert_equal(store.frame_dict(prop_name, i), prop)
+
+    keys, features, values = store.read("bp")
+    assert keys == [0, 1, 2]
+    assert values.shape == (5, 3, len(features))
+    assert np.all(np.isnan(values[:, 2]))
+
+
+def test_store_truncate(tmp_path):
+    """ frames beyond the truncation are overwritten by the next append
+    """
+    rng = np.random.default_rng(1)
+    path = tmp_path / "store"
+    store = RunStore.new(path=path, capacity=4)
+    for frame in range(3):
+        store.append(frame=frame, time=0., props=_frame_props(rng))
+
+    store = RunStore(path=path, capacity=4)
+    store.truncate(1)
+    props = _frame_props(rng)
+    store.append(frame=7, time=0., props=props)
+
+    store = RunStore(path=path)
+    assert store.meta["frames"] == [0, 7]
+    _assert_equal(store.frame_dict("bp", 1), props["bp"][0])
@@ -5,7 +5,6 @@ import os
 
 import pandas as pd
 import numpy as np
-import pickle
 from pathlib import Path
 
 from statistics import mean
@@ -15,6 +14,7 @@ import ipywidgets as widgets
 from linkage import Linkage
 from linker import get_linkage
 from project import Project
+from store import RunStore
 
 """ DESCR:
     collection of scripts for viewing and analysing BDna data.
@@ -55,29 +55,47 @@ class DataPrep(object):
         return link
 
     def _traj_frame(self, frame):
-        traj_path = self.project.output / "frames/"
+        store = RunStore(path=self.project.output / "{}__store".format(
+            self.name))
+        store.check_linkage(self.link)
         data = {}
-        for pickle_name in PROP_TYPE + ["co_angles"]:
-            if pickle_name == "localres":
-                nnn = "{}/{}__{}.p".format(self.project.output,
-                                           self.name,
-                                           pickle_name,
-                                           )
-                try:
-                    prop = pickle.load(open(nnn, "rb"))
-                except FileNotFoundError:
-                    print("flie {} not found".format(nnn))
-                    prop = None
+        for prop_name in PROP_TYPE:
+            if prop_name in store.meta["properties"]:
+                data[prop_name] = store.frame_dict(prop_name, frame)
             else:
-                nnn = "{}/{}__bDNA-{}-{}.p".format(traj_path,
-                                                   self.name,
-                                                   pickle_name,
-                                                   frame
-                                                   )
-                ts, prop = pickle.load(open(nnn, "rb"))
-            data[pickle_name] = prop
+                print("property {} not in store".format(prop_name))
+                data[prop_name] = None
+        data["co_angles"] = self._co_angles(store, frame)
+        ts = {"frame": store.meta["frames"][frame],
+              "time": store.meta["time"][frame],
+              }
         return data, ts
 
+    def _co_angles(self, store, frame):
+        """ stored angles with crossover information from the linkage
+        """
+        co_angles = {}
+        if "co_angles" not in store.meta["properties"]:
+            return co_angles
+        angles = store.frame_dict("co_angles", frame)
+        for key, co_data in angles.items():
+            co = self.link.Fco[key]
+            resindices = []
+            for P in co.Ps:
+                if P is None:
+                    continue
+                elif P.sc is not None:
+                    resindices.append(P.sc.resindex)
+                elif P.st is not None:
+                    resindices.append(P.st.resindex)
+            co_angles[key] = {"co": key,
+                              "type": co.typ,
+                              "is_scaffold": co.is_scaf,
+                              "angles": co_data["angles"],
+                              "resindices": resindices,
+                              }
+        return co_angles
+
     def _categorise(self, plus):
         id_ds = set()
 
@@ -3,7 +3,7 @@
 import contextlib
 import numpy as np
 
-from typing import List
+from typing import List, Dict, Any, Iterator, Tuple, Optional
 
 """ DESCR:
 """
@@ -111,3 +111,81 @@ def _dh_angle(p: list, as_rad=False):  # slow
     angle = - np.arctan2(y, x)
 
     return angle if as_rad else np.rad2deg(angle)
+
+
+# (key path, component index), index () for scalar leaves
+Feature = Tuple[Tuple[Any, ...], Tuple[int, ...]]
+
+
+def _leaves(value: Any, path: Tuple[Any, ...] = ()
+            ) -> Iterator[Tuple[Feature, float]]:
+    """ numeric leaves of nested property dicts as ((keys, index), value).
+        vectors (arrays, lists, tuples) are stored per component, bools as
+        0/1, str leaves are labels and not stored.
+    """
+    if isinstance(value, dict):
+        for key, sub in value.items():
+            yield from _leaves(sub, path + (key,))
+    elif isinstance(value, (float, int, np.number, np.bool_)):
+        yield (path, ()), float(value)
+    elif isinstance(value, (np.ndarray, list, tuple)):
+        array = np.asarray(value)
+        if not (np.issubdtype(array.dtype, np.number)
+                or array.dtype == bool):
+            raise UnexpectedCaseError(
+                "non-numeric vector {} cannot be stored".format(path))
+        for index in np.ndindex(array.shape):
+            yield (path, index), float(array[index])
+    elif not isinstance(value, str):
+        raise UnexpectedCaseError("leaf {} of type {} cannot be stored"
+                                  .format(path, type(value).__name__))
+
+
+def _flatten(prop: Dict[Any, Any],
+             keys: List[Any],
+             features: Optional[List[Feature]] = None,
+             ) -> Tuple[List[Feature], "np.ndarray"]:
+    """ nested property dict {key: {...}} as array [len(keys), features].
+        features are collected from the leaves if not given. missing keys or
+        leaves are nan
+    """
+    rows = [dict(_leaves(prop.get(key, {}))) for key in keys]
+    if features is None:
+        features = list()
+        for leaves in rows:
+            features += [f for f in leaves if f not in features]
+
+    columns = {feature: idx for idx, feature in enumerate(features)}
+    values = np.full((len(keys), len(features)), np.nan)
+    for idx, leaves in enumerate(rows):
+        for feature, value in leaves.items():
+            if feature in columns:
+                values[idx, columns[feature]] = value
+    return features, values
+
+
+def _unflatten(features: List[Feature], values: "np.ndarray") -> Any:
+    """ inverse of _flatten for one key: nested dict of the features,
+        vectors as arrays
+    """
+    vectors: Dict[Tuple[Any, ...], Dict[Tuple[int, ...], float]] = dict()
+    for (path, index), value in zip(features, values):
+        vectors.setdefault(path, dict())[index] = value
+
+    nested: Dict[Any, Any] = dict()
+    for path, components in vectors.items():
+        if () in components:
+            leaf = components[()]
+        else:
+            shape = np.max(list(components), axis=0) + 1
+            leaf = np.full(shape, np.nan)
+            for index, value in components.items():
+                leaf[index] = value
+        if not path:
+            return leaf
+        *parents, key = path
+        sub = nested
+        for parent in parents:
+            sub = sub.setdefault(parent, dict())
+        sub[key] = leaf
+    return nested